@@ -3,4 +3,14 @@ from django.apps import AppConfig
 class UbuntucapConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.ubuntucap'
-    verbose_name = 'UbuntuCap ML Engine'
\ No newline at end of file
+    verbose_name = 'UbuntuCap ML Engine'
+
+    def ready(self):
+        from django.conf import settings
+        from apps.ubuntucap.signals import connect_signals
+        connect_signals()
+        
+        # Optional warm-up so the first scoring request doesn't pay the load
+        if getattr(settings, 'CREDIT_MODEL_WARMUP', False):
+            from apps.ubuntucap.ml_engine.credit_scorer import get_credit_model
+            get_credit_model()
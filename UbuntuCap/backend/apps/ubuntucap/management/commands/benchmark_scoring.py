@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.ubuntucap.ml_engine.training.trainer import MLModelTrainer
+from apps.ubuntucap.ml_engine.compiled_ensemble import CompiledEnsemble
+from sklearn.ensemble import RandomForestRegressor
+import numpy as np
+import time
+import warnings
+
+class Command(BaseCommand):
+    help = 'Benchmark sklearn vs compiled tree-ensemble inference latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=2000,
+            help='Number of single-row predictions to time per engine'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per batch for the throughput comparison'
+        )
+        parser.add_argument(
+            '--random-forest',
+            action='store_true',
+            help='Benchmark a freshly fitted RandomForest instead of the saved model'
+        )
+
+    def handle(self, *args, **options):
+        trainer = MLModelTrainer()
+        df = trainer.generate_synthetic_data(max(options['batch_size'], 1000), save=False)
+        X = df[trainer.features].to_numpy(dtype=float)
+
+        model = None if options['random_forest'] else trainer.load_model()[0]
+        if model is None:
+            self.stdout.write('🌲 Fitting RandomForestRegressor(n_estimators=100) on synthetic data...')
+            model = RandomForestRegressor(n_estimators=100, random_state=42)
+            model.fit(X, df[trainer.target].to_numpy())
+
+        if not CompiledEnsemble.supports(model):
+            raise CommandError(f'{type(model).__name__} is not a tree ensemble; nothing to compile')
+
+        compiled = CompiledEnsemble.from_model(model)
+
+        with warnings.catch_warnings():
+            # Models fitted on DataFrames warn about missing feature names on every call
+            warnings.simplefilter('ignore', UserWarning)
+
+            max_diff = np.abs(model.predict(X) - compiled.predict(X)).max()
+            self.stdout.write(f'🔍 Max |sklearn - compiled| over {len(X)} rows: {max_diff:.2e}')
+            if max_diff > 1e-6:
+                raise CommandError('Compiled predictions differ from sklearn')
+
+            self.stdout.write(f'⏱️  Single-row latency over {options["iterations"]} calls ({type(model).__name__})')
+            for name, predict in (('sklearn', model.predict), ('compiled', compiled.predict)):
+                p50, p99 = self._time_single_rows(predict, X, options['iterations'])
+                self.stdout.write(f'   {name:<10} p50: {p50:8.3f} ms | p99: {p99:8.3f} ms')
+
+            batch = X[:options['batch_size']]
+            self.stdout.write(f'📦 Batch of {len(batch)} rows')
+            for name, predict in (('sklearn', model.predict), ('compiled', compiled.predict)):
+                started = time.perf_counter()
+                predict(batch)
+                elapsed = (time.perf_counter() - started) * 1000
+                self.stdout.write(f'   {name:<10} {elapsed:8.3f} ms')
+
+    def _time_single_rows(self, predict, X, iterations):
+        timings = np.empty(iterations)
+        for i in range(iterations):
+            row = X[i % len(X)].reshape(1, -1)
+            started = time.perf_counter()
+            predict(row)
+            timings[i] = time.perf_counter() - started
+        return np.percentile(timings, 50) * 1000, np.percentile(timings, 99) * 1000
@@ -1,13 +1,65 @@
-from django.core.management.base import BaseCommand
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
 from apps.ubuntucap.services.mpesa_sync import MpesaDataSync
 
 class Command(BaseCommand):
     help = 'Sync M-Pesa transaction data for all users'
     
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Concurrent M-Pesa fetches (default: MPESA_SYNC_WORKERS)'
+        )
+        parser.add_argument(
+            '--since',
+            help="Fetch transactions after this date (YYYY-MM-DD) instead of each user's last sync"
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Sync at most this many users'
+        )
+        parser.add_argument(
+            '--rebuild-rollups',
+            action='store_true',
+            help='Rebuild the daily M-Pesa rollups from stored transactions instead of syncing'
+        )
+    
     def handle(self, *args, **options):
-        sync_service = MpesaDataSync()
-        synced_count = sync_service.sync_all_active_users()
+        if options['rebuild_rollups']:
+            from apps.ubuntucap.services.mpesa_service import rebuild_daily_rollups
+            
+            rollup_count = rebuild_daily_rollups()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {rollup_count} daily M-Pesa rollups'))
+            return
+        
+        since = None
+        if options['since']:
+            try:
+                since = timezone.make_aware(datetime.strptime(options['since'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+        
+        sync_service = MpesaDataSync(workers=options['workers'])
+        synced_count = sync_service.sync_all_active_users(since=since, limit=options['limit'])
+        stats = sync_service.stats
+        
+        self.stdout.write(
+            f"📊 {stats['fetched']} transactions fetched, {stats['inserted']} new, "
+            f"{stats['duplicates']} already stored"
+        )
+        if stats['users']:
+            self.stdout.write(
+                f"⏱️  Fetch p50 {stats['fetch_p50_seconds']:.3f}s, p95 {stats['fetch_p95_seconds']:.3f}s, "
+                f"max {stats['fetch_max_seconds']:.3f}s with {stats['workers']} workers; "
+                f"ingest {stats['ingest_seconds']:.3f}s; total {stats['total_seconds']:.3f}s"
+            )
+        
+        for failure in sync_service.failures():
+            self.stdout.write(self.style.ERROR(f"❌ {failure['phone_number']}: {failure['error']}"))
         
         self.stdout.write(
             self.style.SUCCESS(f'Successfully synced M-Pesa data for {synced_count} users')
-        )
\ No newline at end of file
+        )
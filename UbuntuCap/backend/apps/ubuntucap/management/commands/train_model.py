@@ -1,5 +1,7 @@
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from apps.ubuntucap.ml_engine.training.trainer import MLModelTrainer
+from apps.ubuntucap.ml_engine.training.jobs import TRAINING_OPTIONS, TrainingJobConflict, TrainingJobRunner
 
 class Command(BaseCommand):
     help = 'Train ML credit scoring model'
@@ -16,39 +18,217 @@ class Command(BaseCommand):
             default=1000,
             help='Number of synthetic samples to generate'
         )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for synthetic data generation'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=-1,
+            help='Parallel worker processes for model fits and CV folds (-1 uses all cores)'
+        )
+        parser.add_argument(
+            '--search',
+            choices=['random', 'halving'],
+            help='Tune each model family with randomized or successive-halving search first'
+        )
+        parser.add_argument(
+            '--trials',
+            type=int,
+            default=20,
+            help='Configurations sampled by the hyperparameter search'
+        )
+        parser.add_argument(
+            '--latency-budget-ms',
+            type=float,
+            default=settings.CREDIT_MODEL_LATENCY_BUDGET_MS,
+            help='p99 single-row scoring budget; slower models are penalized during selection'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Update the saved model with rows changed since its training watermark'
+        )
+        parser.add_argument(
+            '--full-rebuild-days',
+            type=int,
+            default=None,
+            help='With --incremental, run a full rebuild when the last one is older than this'
+        )
+        parser.add_argument(
+            '--no-promote',
+            action='store_true',
+            help='Register the trained model without making it live'
+        )
+        parser.add_argument(
+            '--promote',
+            metavar='VERSION',
+            help='Make an existing model version live instead of training'
+        )
+        parser.add_argument(
+            '--rollback',
+            action='store_true',
+            help='Switch back to the previously live model version instead of training'
+        )
+        parser.add_argument(
+            '--shadow',
+            metavar='VERSION',
+            help='Score live traffic with a model version in shadow mode instead of training'
+        )
+        parser.add_argument(
+            '--stop-shadow',
+            action='store_true',
+            help='Stop shadow scoring instead of training'
+        )
+        parser.add_argument(
+            '--list-versions',
+            action='store_true',
+            help='List registered model versions instead of training'
+        )
+        parser.add_argument(
+            '--job-id',
+            help='Record progress and results in this training job (set by the job runner)'
+        )
+        parser.add_argument(
+            '--dataset',
+            help="Train on a stored dataset snapshot by name ('latest' for the most recent)"
+        )
     
     def handle(self, *args, **options):
+        trainer = MLModelTrainer()
+        registry = trainer.registry
+        
+        # Registry operations only swap the current pointer; no training runs
+        try:
+            if options['promote']:
+                registry.promote(options['promote'])
+                self.stdout.write(self.style.SUCCESS(f'🚀 Version {options["promote"]} is now live'))
+                return
+            if options['rollback']:
+                version = registry.rollback()
+                self.stdout.write(self.style.SUCCESS(f'⏪ Rolled back to version {version}'))
+                return
+            if options['shadow']:
+                registry.set_shadow(options['shadow'])
+                self.stdout.write(self.style.SUCCESS(f'👥 Version {options["shadow"]} is now scoring in shadow mode'))
+                return
+            if options['stop_shadow']:
+                registry.clear_shadow()
+                self.stdout.write(self.style.SUCCESS('👥 Shadow scoring stopped'))
+                return
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        if options['list_versions']:
+            current = registry.current_version()
+            shadow = registry.shadow_version()
+            for version in registry.list_versions():
+                metadata = registry.read_metadata(version)
+                marker = '*' if version == current else 's' if version == shadow else ' '
+                self.stdout.write(
+                    f'{marker} {version}  {metadata["model_name"]:<20} '
+                    f'R²: {metadata["performance"].get("r2", float("nan")):.3f}'
+                )
+            return
+        
+        # Every run holds the training lock, so cron or manual runs never overlap an API job
+        job_runner = TrainingJobRunner(trainer.models_dir)
+        job_id = options['job_id']
+        if job_id:
+            job_runner.mark_running(job_id)
+        else:
+            try:
+                job_id = job_runner.start_local(
+                    {key: options[key] for key in TRAINING_OPTIONS},
+                    requested_by='manage.py train_model'
+                )['job_id']
+            except TrainingJobConflict as e:
+                raise CommandError(str(e))
+        
+        try:
+            result = self._train(trainer, options)
+        except BaseException as e:
+            job_runner.mark_failed(job_id, str(e) or type(e).__name__)
+            raise
+        
+        job_runner.mark_finished(job_id, result)
+    
+    def _train(self, trainer, options):
         self.stdout.write('🚀 Starting ML Model Training...')
         
-        trainer = MLModelTrainer()
+        # Synthetic data is generated by train_models itself
+        if options['synthetic'] and not options['dataset']:
+            self.stdout.write(f'🤖 Generating {options["samples"]} synthetic samples (seed {options["seed"]})...')
         
-        # Generate synthetic data if requested
-        if options['synthetic']:
-            self.stdout.write(f'🤖 Generating {options["samples"]} synthetic samples...')
-            trainer.generate_synthetic_data(options['samples'])
+        progress = lambda done, total: self.stdout.write(f'   📥 Collected {done}/{total} users')
         
-        # Train models
-        self.stdout.write('🏋️ Training ML models...')
-        result = trainer.train_models(use_synthetic=options['synthetic'])
+        if options['incremental']:
+            self.stdout.write('🔁 Incremental retraining...')
+            result = trainer.train_incremental(
+                full_rebuild_days=options['full_rebuild_days'],
+                promote=not options['no_promote'],
+                n_jobs=options['workers'],
+                progress=progress
+            )
+            if result and result['mode'] == 'incremental':
+                if result['rows']:
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f'✅ Updated {result["model_name"]} on {result["rows"]} changed rows '
+                            f'(version {result["version"]})'
+                        )
+                    )
+                elif result.get('pending_rows'):
+                    self.stdout.write(
+                        self.style.SUCCESS(f'✅ Only {result["pending_rows"]} changed rows, left for the next run')
+                    )
+                else:
+                    self.stdout.write(self.style.SUCCESS('✅ No changes since the last training run'))
+                return result
+        else:
+            # Train models
+            self.stdout.write('🏋️ Training ML models...')
+            result = trainer.train_models(
+                use_synthetic=options['synthetic'],
+                dataset=options['dataset'],
+                samples=options['samples'],
+                seed=options['seed'],
+                n_jobs=options['workers'],
+                search=options['search'],
+                n_trials=options['trials'],
+                latency_budget_ms=options['latency_budget_ms'],
+                promote=not options['no_promote'],
+                progress=progress
+            )
         
         if result:
             self.stdout.write(
                 self.style.SUCCESS(
                     f'✅ Training completed! Best model: {result["best_model"]} '
-                    f'(R²: {result["best_score"]:.3f})'
+                    f'(R²: {result["best_score"]:.3f}), version {result["version"]}'
+                    f'{"" if result["promoted"] else " (not promoted)"}'
                 )
             )
+            for name, metrics in result['results'].items():
+                self.stdout.write(f'   ⏱️  {name}: fit {metrics["fit_seconds"]:.2f}s, with CV {metrics["total_fit_seconds"]:.2f}s')
             
             # Evaluate model
             self.stdout.write('📊 Evaluating model...')
-            evaluation = trainer.evaluate_model()
+            evaluation = trainer.evaluate_model(result['version'])
             
             if evaluation:
                 self.stdout.write(
                     self.style.SUCCESS(
                         f'✅ Evaluation - R²: {evaluation["r2"]:.3f}, '
-                        f'MAE: {evaluation["mae"]:.2f}'
+                        f'MAE: {evaluation["mae"]:.2f}, '
+                        f'{evaluation["per_row_ms"]:.4f} ms/row on {evaluation["test_samples"]} hold-out rows'
                     )
                 )
+                result['evaluation'] = {key: value for key, value in evaluation.items() if key != 'feature_importance'}
         else:
             self.stdout.write(self.style.ERROR('❌ Training failed!'))
+        
+        return result
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CreditFeatureVector",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("avg_monthly_volume", models.FloatField(default=0)),
+                ("transaction_consistency", models.FloatField(default=0)),
+                ("business_age_months", models.IntegerField(default=0)),
+                ("savings_ratio", models.FloatField(default=0)),
+                ("loan_history_count", models.IntegerField(default=0)),
+                ("default_rate", models.FloatField(default=0)),
+                ("mpesa_activity_score", models.FloatField(default=0)),
+                ("customer_rating", models.FloatField(default=3.0)),
+                ("transaction_count_30d", models.IntegerField(default=0)),
+                ("income_consistency_score", models.FloatField(default=0)),
+                ("has_regular_income", models.IntegerField(default=0)),
+                ("negative_balance_days", models.IntegerField(default=0)),
+                ("feature_version", models.IntegerField(default=1)),
+                ("computed_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="credit_features",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "credit_feature_vectors",
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ubuntucap", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="creditfeaturevector",
+            name="computed_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,96 @@
+from concurrent.futures import Future
+import numpy as np
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """Groups single-row predictions that arrive within a few milliseconds.
+
+    Callers submit one feature row and block on a future; a background
+    thread collects up to max_batch_size rows (waiting at most max_wait_ms
+    after the first one), runs predict_fn once on the stacked matrix and
+    hands each caller its own result. Rows are only batched with rows that
+    share the same context (the model artifacts they were scored against),
+    so a hot reload never mixes model versions in one call.
+
+    This only pays off when a worker serves requests concurrently (threaded
+    workers); with one request per process there is nothing to batch.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=2):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self.batches = 0
+        self.rows = 0
+
+    def _ensure_started(self):
+        # Threads don't survive a fork, so each worker process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            thread = threading.Thread(target=self._run, args=(self._queue,), name='credit-score-batcher', daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, row, context=None):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((context, np.asarray(row, dtype=float), future))
+        return future
+
+    def predict(self, row, context=None, timeout=None):
+        return self.submit(row, context).result(timeout=timeout)
+
+    def _collect(self, pending):
+        batch = [pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, pending):
+        while True:
+            batch = self._collect(pending)
+
+            groups = {}
+            for context, row, future in batch:
+                groups.setdefault(id(context), (context, []))[1].append((row, future))
+
+            for context, items in groups.values():
+                futures = [future for _, future in items]
+                try:
+                    predictions = self.predict_fn(context, np.vstack([row for row, _ in items]))
+                    for future, prediction in zip(futures, predictions):
+                        future.set_result(prediction)
+                except Exception as e:
+                    logger.error(f"Micro-batch prediction failed: {e}")
+                    for future in futures:
+                        future.set_exception(e)
+
+            self.batches += 1
+            self.rows += len(batch)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'rows': self.rows,
+            'avg_batch_size': round(self.rows / self.batches, 2) if self.batches else 0.0
+        }
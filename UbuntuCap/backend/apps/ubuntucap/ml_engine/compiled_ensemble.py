@@ -0,0 +1,110 @@
+import numpy as np
+import joblib
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CompiledEnsemble:
+    """Tree ensemble flattened into contiguous node arrays.
+
+    Every tree of the ensemble is laid out back to back in the same
+    feature/threshold/left/right/value arrays; roots holds the index of
+    each tree's first node. A prediction is base + scale * sum of the
+    leaf values reached in every tree, which covers random forests
+    (scale = 1 / n_trees) and gradient boosting (base = init prediction,
+    scale = learning rate). All trees are walked at once with NumPy, so
+    there is no per-call validation or joblib dispatch.
+    """
+
+    SUPPORTED_MODELS = (
+        'DecisionTreeRegressor',
+        'RandomForestRegressor',
+        'ExtraTreesRegressor',
+        'GradientBoostingRegressor'
+    )
+
+    def __init__(self, feature, threshold, left, right, value, roots, base, scale, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.base = float(base)
+        self.scale = float(scale)
+        self.max_depth = int(max_depth)
+
+    @classmethod
+    def supports(cls, model):
+        return type(model).__name__ in cls.SUPPORTED_MODELS
+
+    @classmethod
+    def from_model(cls, model):
+        """Flatten a fitted sklearn tree regressor or tree ensemble"""
+        name = type(model).__name__
+        if name not in cls.SUPPORTED_MODELS:
+            raise ValueError(f"Cannot compile {name}")
+
+        if name == 'GradientBoostingRegressor':
+            trees = [estimator.tree_ for estimator in model.estimators_[:, 0]]
+            scale = model.learning_rate
+            if model.init_ == 'zero':
+                base = 0.0
+            elif hasattr(model.init_, 'constant_'):
+                base = float(np.ravel(model.init_.constant_)[0])
+            else:
+                raise ValueError(f"Cannot compile init estimator {type(model.init_).__name__}")
+        elif name == 'DecisionTreeRegressor':
+            trees = [model.tree_]
+            base, scale = 0.0, 1.0
+        else:
+            trees = [estimator.tree_ for estimator in model.estimators_]
+            base, scale = 0.0, 1.0 / len(trees)
+
+        sizes = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+        def children(tree, offset, side):
+            nodes = getattr(tree, side).astype(np.int64)
+            return np.where(nodes < 0, -1, nodes + offset)
+
+        return cls(
+            feature=np.concatenate([tree.feature for tree in trees]).astype(np.int64),
+            threshold=np.concatenate([tree.threshold for tree in trees]).astype(np.float64),
+            left=np.concatenate([children(tree, offset, 'children_left') for tree, offset in zip(trees, offsets)]),
+            right=np.concatenate([children(tree, offset, 'children_right') for tree, offset in zip(trees, offsets)]),
+            value=np.concatenate([tree.value[:, 0, 0] for tree in trees]).astype(np.float64),
+            roots=offsets.astype(np.int64),
+            base=base,
+            scale=scale,
+            max_depth=max(tree.max_depth for tree in trees)
+        )
+
+    def predict(self, X):
+        # sklearn casts inputs to float32 before comparing against thresholds
+        X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+        rows = np.arange(X.shape[0])[:, None]
+        node = np.broadcast_to(self.roots, (X.shape[0], len(self.roots))).copy()
+
+        for _ in range(self.max_depth):
+            left = self.left[node]
+            is_leaf = left < 0
+            if is_leaf.all():
+                break
+            feature = np.where(is_leaf, 0, self.feature[node])
+            go_left = X[rows, feature] <= self.threshold[node]
+            node = np.where(is_leaf, node, np.where(go_left, left, self.right[node]))
+
+        return self.base + self.scale * self.value[node].sum(axis=1)
+
+    def save(self, path):
+        """Write the arrays uncompressed so they can be loaded memory-mapped"""
+        tmp_path = f"{path}.tmp"
+        joblib.dump(self.__dict__, tmp_path, compress=0)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        return cls(**joblib.load(path, mmap_mode=mmap_mode))
@@ -2,62 +2,263 @@ import pandas as pd
 import numpy as np
 import joblib
 import os
+import json
 import logging
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from django.conf import settings
+from .features import FEATURE_NAMES, with_loan_stats, attach_loan_stats
+from .feature_store import get_features, load_features
+from .score_cache import score_cache
+from .rules import BASE_SCORE, score_features
+from .registry import ModelRegistry
+from .shadow import ShadowScorer
+from .batching import MicroBatcher
 
 logger = logging.getLogger(__name__)
 
+_credit_model = None
+_credit_model_lock = threading.Lock()
+
+def get_credit_model():
+    """Return the process-wide CreditScoringModel, loading it on first use"""
+    global _credit_model
+    if _credit_model is None:
+        with _credit_model_lock:
+            if _credit_model is None:
+                _credit_model = CreditScoringModel()
+    return _credit_model
+
+class ModelArtifacts:
+    """Model, scaler, version and optional compiled ensemble, always swapped together.
+
+    With a compiled ensemble the sklearn model can be given as a
+    model_loader instead; it is then only unpickled the first time .model
+    is read (feature importance), so workers that just serve predictions
+    hold the memory-mapped compiled arrays alone.
+    """
+
+    def __init__(self, model, scaler, version, compiled=None, model_loader=None):
+        self._model = model
+        self._model_loader = model_loader
+        self._lock = threading.Lock()
+        self.scaler = scaler
+        self.version = version
+        self.compiled = compiled
+
+    @property
+    def has_model(self):
+        return self._model is not None or self._model_loader is not None
+
+    @property
+    def model(self):
+        if self._model is None and self._model_loader is not None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._model_loader()
+        return self._model
+
+RULE_BASED = ModelArtifacts(None, None, 'rules')
+
 class CreditScoringModel:
     def __init__(self):
-        self.model = None
-        self.scaler = None
-        self.features = [
-            'avg_monthly_volume',
-            'transaction_consistency', 
-            'business_age_months',
-            'savings_ratio',
-            'loan_history_count',
-            'default_rate',
-            'mpesa_activity_score',
-            'customer_rating',
-            'transaction_count_30d',
-            'income_consistency_score', 
-            'has_regular_income',
-            'negative_balance_days'
-        ]
+        self._artifacts = RULE_BASED
+        self.features = list(FEATURE_NAMES)
         self.model_path = os.path.join(settings.BASE_DIR, 'ml_models', 'credit_model.pkl')
         self.scaler_path = os.path.join(settings.BASE_DIR, 'ml_models', 'scaler.pkl')
+        self.metadata_path = os.path.join(settings.BASE_DIR, 'ml_models', 'model_metadata.json')
+        self.registry = ModelRegistry(os.path.join(settings.BASE_DIR, 'ml_models'))
+        self.reload_interval = getattr(settings, 'CREDIT_MODEL_RELOAD_INTERVAL', 30)
+        self.use_mmap = getattr(settings, 'CREDIT_MODEL_MMAP', True)
+        self.use_compiled = getattr(settings, 'CREDIT_MODEL_COMPILED', True)
+        self.batcher = None
+        if getattr(settings, 'CREDIT_MODEL_MICROBATCH', False):
+            self.batcher = MicroBatcher(
+                self._predict_matrix,
+                max_batch_size=getattr(settings, 'CREDIT_MODEL_MICROBATCH_MAX_SIZE', 32),
+                max_wait_ms=getattr(settings, 'CREDIT_MODEL_MICROBATCH_MAX_WAIT_MS', 2)
+            )
+        self.shadow = None
+        self._reload_lock = threading.Lock()
+        self._last_version_check = time.monotonic()
+        self._signature = None
         self.load_model()
+        self._sync_shadow()
+    
+    @property
+    def model(self):
+        return self._artifacts.model
+    
+    @property
+    def scaler(self):
+        return self._artifacts.scaler
+    
+    @property
+    def model_version(self):
+        return self._artifacts.version
     
     def load_model(self):
         """Load pre-trained ML model or fallback to rule-based"""
+        self._signature = self._artifact_signature()
         try:
-            if os.path.exists(self.model_path) and os.path.exists(self.scaler_path):
-                self.model = joblib.load(self.model_path)
-                self.scaler = joblib.load(self.scaler_path)
-                logger.info("✅ ML model loaded successfully")
-            else:
+            self._artifacts = self._load_artifacts()
+            if not self._artifacts.has_model:
                 logger.info("⚠️ No trained ML model found. Using rule-based scoring.")
-                self.model = None
-                self.scaler = None
+            else:
+                logger.info(f"✅ ML model loaded successfully (version {self.model_version})")
         except Exception as e:
             logger.error(f"Error loading ML model: {e}")
-            self.model = None
-            self.scaler = None
+            self._artifacts = RULE_BASED
+    
+    def _load_artifacts(self):
+        # Promoted registry versions take precedence over the legacy flat files
+        if self.registry.current_version() is not None:
+            return self._load_version(self.registry.resolve())
+        
+        if not (os.path.exists(self.model_path) and os.path.exists(self.scaler_path)):
+            return RULE_BASED
+        return ModelArtifacts(
+            joblib.load(self.model_path),
+            joblib.load(self.scaler_path),
+            self._read_model_version()
+        )
+    
+    def _load_version(self, version):
+        """Artifacts of a registry version; tree ensembles are served from the compiled arrays alone"""
+        compiled = self.registry.load_compiled(version, self.use_mmap) if self.use_compiled else None
+        scaler = self.registry.load_scaler(version)
+        if compiled is None:
+            return ModelArtifacts(self.registry.load_model(version, self.use_mmap), scaler, version)
+        
+        return ModelArtifacts(
+            None, scaler, version, compiled,
+            model_loader=lambda: self.registry.load_model(version, self.use_mmap)
+        )
+    
+    def _read_model_version(self):
+        """Identify the loaded model by its training date, or file mtime without metadata"""
+        try:
+            with open(self.metadata_path) as f:
+                return json.load(f)['training_date']
+        except Exception:
+            return str(os.path.getmtime(self.model_path))
+    
+    def _artifact_signature(self):
+        version = self.registry.current_version()
+        if version is not None:
+            return ('registry', version)
+        
+        # The trainer writes metadata last, so it only changes once the model and scaler are complete
+        for path in (self.metadata_path, self.model_path):
+            try:
+                stat = os.stat(path)
+                return (path, stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                continue
+        return None
+    
+    def maybe_reload(self):
+        """Reload the model if a new version was written, checking at most every reload_interval seconds.
+
+        The new artifacts are swapped in with a single assignment: requests
+        that already took a reference finish on the old model.
+        """
+        if self.reload_interval is None or self.reload_interval <= 0:
+            return False
+        if time.monotonic() - self._last_version_check < self.reload_interval:
+            return False
+        if not self._reload_lock.acquire(blocking=False):
+            return False  # Another thread is already checking
+        
+        try:
+            self._last_version_check = time.monotonic()
+            self._sync_shadow()
+            signature = self._artifact_signature()
+            if signature == self._signature:
+                return False
+            
+            artifacts = self._load_artifacts()
+            self._artifacts = artifacts
+            self._signature = signature
+            logger.info(f"🔄 Reloaded credit model (version {artifacts.version})")
+            return True
+        except Exception as e:
+            logger.error(f"Model reload failed, keeping version {self.model_version}: {e}")
+            return False
+        finally:
+            self._reload_lock.release()
+    
+    def _sync_shadow(self):
+        """Start, switch or stop shadow scoring to follow the registry's shadow pointer.
+
+        Only the version is recorded here; the candidate is loaded on the
+        shadow thread, so a pointer change never slows down a request.
+        """
+        try:
+            version = self.registry.shadow_version()
+            current = self.shadow.version if self.shadow else None
+            if version == current:
+                return
+            
+            if self.shadow:
+                self.shadow.stop()
+            if version is None:
+                self.shadow = None
+                logger.info(f"👥 Stopped shadow scoring with version {current}")
+                return
+            
+            self.shadow = ShadowScorer(
+                version,
+                lambda: self._load_version(version),
+                self.score_matrix,
+                max_queue=getattr(settings, 'CREDIT_MODEL_SHADOW_QUEUE_SIZE', 10000)
+            )
+            logger.info(f"👥 Shadow scoring with version {version}")
+        except Exception as e:
+            logger.error(f"Could not start shadow scoring: {e}")
+            self.shadow = None
+    
+    def _submit_shadow(self, user, score):
+        # Only enqueues: the candidate model runs on the shadow thread
+        shadow = self.shadow
+        if shadow is None:
+            return
+        try:
+            features = self._extract_features(user)
+            shadow.submit([[features[name] for name in self.features]], [score])
+        except Exception as e:
+            logger.error(f"Shadow submit failed: {e}")
+    
+    def shadow_stats(self):
+        shadow = self.shadow
+        return shadow.stats() if shadow else None
     
     def predict_credit_score(self, user):
+        """Predict credit score, served from the score cache when possible"""
+        self.maybe_reload()
+        artifacts = self._artifacts
+        
+        user_id = getattr(user, 'pk', None)
+        if user_id is None:
+            return self._predict_credit_score(user, artifacts)
+
+        score = score_cache.get(user_id, artifacts.version)
+        if score is None:
+            score = self._predict_credit_score(user, artifacts)
+            score_cache.set(user_id, artifacts.version, score)
+            self._submit_shadow(user, score)
+        return score
+
+    def _predict_credit_score(self, user, artifacts):
         """Predict credit score using ML model or fallback to rule-based"""
         try:
-            if self.model:
+            if artifacts.has_model:
                 # Use ML model prediction
                 features = self._extract_features(user)
-                feature_vector = np.array([list(features.values())])
-                
-                # Scale features if using linear model
-                if hasattr(self.model, 'coef_'):
-                    feature_vector = self.scaler.transform(feature_vector)
+                feature_vector = np.array([[features[name] for name in self.features]])
                 
-                ml_score = self.model.predict(feature_vector)[0]
+                ml_score = self._predict_row(artifacts, feature_vector)
                 logger.info(f"🤖 ML prediction: {ml_score:.1f}")
                 return max(0, min(100, ml_score))
             else:
@@ -67,57 +268,110 @@ class CreditScoringModel:
         except Exception as e:
             logger.error(f"ML prediction failed: {e}")
             return self._rule_based_scoring(user)
-    
+
+    def _predict_row(self, artifacts, feature_vector):
+        """Predict one row, through the micro-batcher when it is enabled"""
+        if self.batcher is not None:
+            try:
+                return self.batcher.predict(feature_vector[0], artifacts, timeout=1.0)
+            except FutureTimeoutError:
+                logger.warning("Micro-batch timed out, predicting directly")
+        return self._predict_matrix(artifacts, feature_vector)[0]
+
+    def _predict_matrix(self, artifacts, feature_matrix):
+        # Tree ensembles never use the scaler, so the compiled path skips it.
+        # It is used for every input so the sklearn model never has to be
+        # loaded, although sklearn's own loop is faster on large batches.
+        if artifacts.compiled is not None:
+            return artifacts.compiled.predict(feature_matrix)
+        
+        # Scale features if using linear model
+        if hasattr(artifacts.model, 'coef_'):
+            feature_matrix = artifacts.scaler.transform(feature_matrix)
+        return artifacts.model.predict(feature_matrix)
+
+    def predict_credit_scores(self, users, chunk_size=1000):
+        """Predict credit scores for many users, one model call per chunk.
+
+        Accepts a User queryset or any iterable of users and returns a dict
+        mapping user id to score.
+        """
+        self.maybe_reload()
+        artifacts = self._artifacts
+
+        if hasattr(users, 'select_related'):
+            users = with_loan_stats(users.select_related('profile')).iterator(chunk_size=chunk_size)
+
+        scores = {}
+        chunk = []
+        for user in users:
+            chunk.append(user)
+            if len(chunk) >= chunk_size:
+                scores.update(self._score_chunk(chunk, artifacts))
+                chunk = []
+        if chunk:
+            scores.update(self._score_chunk(chunk, artifacts))
+
+        score_cache.set_many(scores, artifacts.version)
+
+        logger.info(f"🤖 Batch scored {len(scores)} users")
+        return scores
+
+    def _score_chunk(self, users, artifacts):
+        """Score a list of users with a single scaler/model call"""
+        attach_loan_stats(users)
+
+        stored = load_features(users)
+        default_features = {feature: 0 for feature in self.features}
+        feature_matrix = np.array([
+            [stored.get(user.pk, default_features)[name] for name in self.features]
+            for user in users
+        ], dtype=float)
+
+        scores = self.score_matrix(feature_matrix, artifacts)
+        if self.shadow is not None:
+            self.shadow.submit(feature_matrix, scores)
+        return {user.id: float(score) for user, score in zip(users, scores)}
+
+    def score_matrix(self, feature_matrix, artifacts=None):
+        """Score a feature matrix (columns in self.features order) with one model call"""
+        if artifacts is None:
+            artifacts = self._artifacts
+
+        if not artifacts.has_model:
+            rule_scores, _ = score_features(feature_matrix)
+            return rule_scores.astype(float)
+
+        try:
+            return np.clip(self._predict_matrix(artifacts, feature_matrix), 0, 100)
+
+        except Exception as e:
+            logger.error(f"Batch ML prediction failed: {e}")
+            rule_scores, _ = score_features(feature_matrix)
+            return rule_scores.astype(float)
+
     def _extract_features(self, user):
-        """Extract features for ML model with safe defaults for missing fields"""
+        """Extract features for ML model from the feature store"""
         try:
-            profile = user.profile
-            
-            # Safe feature extraction with defaults for missing fields
-            features = {
-                'avg_monthly_volume': float(getattr(profile, 'avg_monthly_volume', 0)),
-                'transaction_consistency': getattr(profile, 'transaction_consistency', 0.5),
-                'business_age_months': getattr(user, 'business_age_months', 0),
-                'savings_ratio': getattr(profile, 'savings_ratio', 0),
-                'loan_history_count': user.loans.count() if hasattr(user, 'loans') else 0,
-                'default_rate': self._calculate_default_rate(user),
-                'mpesa_activity_score': self._calculate_activity_score(profile),
-                'customer_rating': getattr(profile, 'customer_rating', 3.0) or 3.0,
-                'transaction_count_30d': getattr(profile, 'transaction_count_30d', 0),
-                'income_consistency_score': getattr(profile, 'income_consistency_score', 0.5),
-                'has_regular_income': 1 if getattr(profile, 'has_regular_income', False) else 0,
-                'negative_balance_days': getattr(profile, 'negative_balance_days', 0)  # Safe default
-            }
-            
-            return features
+            return get_features(user)
         except Exception as e:
             logger.error(f"Error extracting features: {e}")
             # Return safe defaults for all features
             return {feature: 0 for feature in self.features}
     
-    def _calculate_default_rate(self, user):
-        """Calculate user's default rate"""
-        try:
-            if not hasattr(user, 'loans'):
-                return 0.0
-            total_loans = user.loans.count()
-            if total_loans == 0:
-                return 0.0
-            defaulted_loans = user.loans.filter(status='defaulted').count()
-            return defaulted_loans / total_loans
-        except:
-            return 0.0
-    
-    def _calculate_activity_score(self, profile):
-        """Calculate M-Pesa activity score"""
-        activity_map = {
-            'very_high': 0.9,
-            'high': 0.7,
-            'medium': 0.5,
-            'low': 0.3
-        }
-        return activity_map.get(getattr(profile, 'mpesa_activity_level', 'medium'), 0.5)
-    
+    def get_feature_importance(self):
+        """Feature importance of the loaded model (empty for rule-based scoring)"""
+        model = self.model
+        if model is None:
+            return {}
+        if hasattr(model, 'feature_importances_'):
+            importance = model.feature_importances_
+        elif hasattr(model, 'coef_'):
+            importance = np.abs(model.coef_) / (np.abs(model.coef_).sum() or 1)
+        else:
+            return {}
+        return {feature: round(float(value), 4) for feature, value in zip(self.features, importance)}
+
     def predict_credit_risk(self, user):
         """Predict credit risk category"""
         score = self.predict_credit_score(user)
@@ -136,168 +390,18 @@ class CreditScoringModel:
     def _rule_based_scoring(self, user):
         """Enhanced rule-based scoring with M-Pesa data"""
         try:
-            profile = user.profile
-            score = 50  # Base score
-            
-            # Monthly volume scoring (0-20 points)
-            volume = float(getattr(profile, 'avg_monthly_volume', 0))
-            if volume > 100000:
-                score += 20
-            elif volume > 50000:
-                score += 15
-            elif volume > 25000:
-                score += 10
-            elif volume > 10000:
-                score += 5
-            
-            # Business age scoring (0-15 points)
-            business_age = getattr(user, 'business_age_months', 0)
-            if business_age > 24:
-                score += 15
-            elif business_age > 12:
-                score += 10
-            elif business_age > 6:
-                score += 5
-            
-            # Transaction consistency (0-15 points)
-            consistency = getattr(profile, 'transaction_consistency', 0)
-            if consistency > 0.8:
-                score += 15
-            elif consistency > 0.6:
-                score += 10
-            elif consistency > 0.4:
-                score += 5
-            
-            # Savings ratio (0-10 points)
-            savings = getattr(profile, 'savings_ratio', 0)
-            if savings > 0.2:
-                score += 10
-            elif savings > 0.1:
-                score += 5
-            
-            # M-Pesa activity level (0-10 points)
-            activity_level = getattr(profile, 'mpesa_activity_level', 'medium')
-            if activity_level == 'very_high':
-                score += 10
-            elif activity_level == 'high':
-                score += 7
-            elif activity_level == 'medium':
-                score += 4
-            
-            # Loan history (0-10 points)
-            loan_count = user.loans.count() if hasattr(user, 'loans') else 0
-            if loan_count > 5:
-                score += 10
-            elif loan_count > 2:
-                score += 7
-            elif loan_count > 0:
-                score += 4
-            
-            # Default rate penalty (0 to -20 points)
-            default_rate = self._calculate_default_rate(user)
-            if default_rate > 0.5:
-                score -= 20
-            elif default_rate > 0.3:
-                score -= 15
-            elif default_rate > 0.1:
-                score -= 10
-            elif default_rate > 0:
-                score -= 5
-            
-            # Customer rating (0-10 points)
-            rating = getattr(profile, 'customer_rating', 3.0) or 3.0
-            if rating >= 4.5:
-                score += 10
-            elif rating >= 4.0:
-                score += 7
-            elif rating >= 3.5:
-                score += 4
-            elif rating >= 3.0:
-                score += 2
-            
-            return max(0, min(100, score))
-            
+            return self.get_score_breakdown(user)['final_score']
         except Exception as e:
             logger.error(f"Rule-based scoring failed: {e}")
             return 50
     
     def get_score_breakdown(self, user):
         """Get detailed breakdown of credit score calculation"""
-        profile = user.profile
-        
-        breakdown = {
-            'base_score': 50,
-            'volume_score': self._calculate_volume_score(profile),
-            'business_age_score': self._calculate_business_age_score(user),
-            'consistency_score': self._calculate_consistency_score(profile),
-            'savings_score': self._calculate_savings_score(profile),
-            'activity_score': self._calculate_activity_score_points(profile),
-            'loan_history_score': self._calculate_loan_history_score(user),
-            'default_penalty': self._calculate_default_penalty(user),
-            'rating_score': self._calculate_rating_score(profile)
-        }
+        features = self._extract_features(user)
+        final_scores, components = score_features([[features[name] for name in self.features]])
         
-        total_score = sum(breakdown.values())
-        breakdown['final_score'] = max(0, min(100, total_score))
+        breakdown = {'base_score': BASE_SCORE}
+        breakdown.update({component: int(points[0]) for component, points in components.items()})
+        breakdown['final_score'] = int(final_scores[0])
         
         return breakdown
-    
-    def _calculate_volume_score(self, profile):
-        volume = float(getattr(profile, 'avg_monthly_volume', 0))
-        if volume > 100000: return 20
-        elif volume > 50000: return 15
-        elif volume > 25000: return 10
-        elif volume > 10000: return 5
-        return 0
-    
-    def _calculate_business_age_score(self, user):
-        business_age = getattr(user, 'business_age_months', 0)
-        if business_age > 24: return 15
-        elif business_age > 12: return 10
-        elif business_age > 6: return 5
-        return 0
-    
-    def _calculate_consistency_score(self, profile):
-        consistency = getattr(profile, 'transaction_consistency', 0)
-        if consistency > 0.8: return 15
-        elif consistency > 0.6: return 10
-        elif consistency > 0.4: return 5
-        return 0
-    
-    def _calculate_savings_score(self, profile):
-        savings = getattr(profile, 'savings_ratio', 0)
-        if savings > 0.2: return 10
-        elif savings > 0.1: return 5
-        return 0
-    
-    def _calculate_activity_score_points(self, profile):
-        activity_level = getattr(profile, 'mpesa_activity_level', 'medium')
-        if activity_level == 'very_high': return 10
-        elif activity_level == 'high': return 7
-        elif activity_level == 'medium': return 4
-        return 0
-    
-    def _calculate_loan_history_score(self, user):
-        if not hasattr(user, 'loans'):
-            return 0
-        loan_count = user.loans.count()
-        if loan_count > 5: return 10
-        elif loan_count > 2: return 7
-        elif loan_count > 0: return 4
-        return 0
-    
-    def _calculate_default_penalty(self, user):
-        default_rate = self._calculate_default_rate(user)
-        if default_rate > 0.5: return -20
-        elif default_rate > 0.3: return -15
-        elif default_rate > 0.1: return -10
-        elif default_rate > 0: return -5
-        return 0
-    
-    def _calculate_rating_score(self, profile):
-        rating = getattr(profile, 'customer_rating', 3.0) or 3.0
-        if rating >= 4.5: return 10
-        elif rating >= 4.0: return 7
-        elif rating >= 3.5: return 4
-        elif rating >= 3.0: return 2
-        return 0
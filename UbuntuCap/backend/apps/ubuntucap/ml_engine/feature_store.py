@@ -0,0 +1,86 @@
+from django.db import transaction
+import logging
+from .features import FEATURE_NAMES, FEATURE_VERSION, attach_loan_stats, compute_features
+
+logger = logging.getLogger(__name__)
+
+def get_features(user):
+    """Return the stored feature vector for a user, computing it on a miss"""
+    from apps.ubuntucap.models import CreditFeatureVector
+
+    # Unsaved or mock users (e.g. quick credit check) are never stored
+    if getattr(user, 'pk', None) is None:
+        return compute_features(user)
+
+    try:
+        vector = user.credit_features
+        if vector.is_current:
+            return vector.as_dict()
+    except CreditFeatureVector.DoesNotExist:
+        pass
+
+    return refresh_features(user).as_dict()
+
+def refresh_features(user):
+    """Recompute and persist one user's feature vector"""
+    from apps.ubuntucap.models import CreditFeatureVector
+
+    # Drop memoized loan stats so the vector reflects the current loans
+    user.__dict__.pop('loan_count', None)
+    user.__dict__.pop('defaulted_loan_count', None)
+
+    features = compute_features(user)
+    vector, created = CreditFeatureVector.objects.update_or_create(
+        user=user,
+        defaults={**features, 'feature_version': FEATURE_VERSION}
+    )
+    user.credit_features = vector
+    return vector
+
+def load_features(users):
+    """Load feature vectors for many users, backfilling missing or outdated rows in bulk"""
+    from apps.ubuntucap.models import CreditFeatureVector
+
+    users = list(users)
+    stored = {
+        vector.user_id: vector.as_dict()
+        for vector in CreditFeatureVector.objects.filter(user__in=users, feature_version=FEATURE_VERSION)
+    }
+
+    missing = [user for user in users if user.pk not in stored]
+    if missing:
+        backfilled = refresh_features_many(missing)
+        stored.update(backfilled)
+        logger.info(f"📦 Backfilled {len(backfilled)} feature vectors")
+
+    return stored
+
+def refresh_features_many(users):
+    """Recompute and persist feature vectors for many users in one upsert.
+
+    Loan stats already annotated by with_loan_stats are used as they are;
+    the rest are loaded with one grouped query.
+    """
+    from apps.ubuntucap.models import CreditFeatureVector
+
+    attach_loan_stats(users)
+
+    computed = {}
+    vectors = []
+    for user in users:
+        try:
+            features = compute_features(user)
+        except Exception as e:
+            logger.warning(f"Could not compute features for user {user.pk}: {e}")
+            continue
+        computed[user.pk] = features
+        vectors.append(CreditFeatureVector(user=user, feature_version=FEATURE_VERSION, **features))
+
+    with transaction.atomic():
+        CreditFeatureVector.objects.bulk_create(
+            vectors,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=FEATURE_NAMES + ['feature_version', 'computed_at']
+        )
+    return computed
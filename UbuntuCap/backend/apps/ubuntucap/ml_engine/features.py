@@ -0,0 +1,110 @@
+from django.db.models import Count, Q
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the definition below changes so stored vectors get recomputed
+FEATURE_VERSION = 1
+
+FEATURE_NAMES = [
+    'avg_monthly_volume',
+    'transaction_consistency',
+    'business_age_months',
+    'savings_ratio',
+    'loan_history_count',
+    'default_rate',
+    'mpesa_activity_score',
+    'customer_rating',
+    'transaction_count_30d',
+    'income_consistency_score',
+    'has_regular_income',
+    'negative_balance_days'
+]
+
+ACTIVITY_SCORES = {
+    'very_high': 0.9,
+    'high': 0.7,
+    'medium': 0.5,
+    'low': 0.3
+}
+
+def with_loan_stats(queryset):
+    """Annotate a User queryset with loan and default counts in one query"""
+    return queryset.annotate(
+        loan_count=Count('loans'),
+        defaulted_loan_count=Count('loans', filter=Q(loans__status='defaulted'))
+    )
+
+def attach_loan_stats(users):
+    """Load loan stats for a list of users with one grouped query on loans"""
+    from apps.loans.models import Loan
+
+    pending = [
+        user for user in users
+        if hasattr(user, 'loans') and not hasattr(user, 'defaulted_loan_count')
+    ]
+    if not pending:
+        return users
+
+    stats = {
+        row['user_id']: row
+        for row in Loan.objects.filter(user__in=pending).values('user_id').annotate(
+            total=Count('id'),
+            defaulted=Count('id', filter=Q(status='defaulted'))
+        )
+    }
+    for user in pending:
+        row = stats.get(user.pk, {})
+        user.loan_count = row.get('total', 0)
+        user.defaulted_loan_count = row.get('defaulted', 0)
+
+    return users
+
+def get_loan_stats(user):
+    """Return (loan_count, defaulted_loan_count), querying at most once per user"""
+    if not hasattr(user, 'loans'):
+        return 0, 0
+
+    if not hasattr(user, 'defaulted_loan_count'):
+        try:
+            stats = user.loans.aggregate(
+                total=Count('id'),
+                defaulted=Count('id', filter=Q(status='defaulted'))
+            )
+            user.loan_count = stats['total']
+            user.defaulted_loan_count = stats['defaulted']
+        except Exception as e:
+            logger.error(f"Error loading loan stats: {e}")
+            return 0, 0
+
+    return user.loan_count, user.defaulted_loan_count
+
+def calculate_default_rate(user):
+    """Calculate user's default rate from cached loan stats"""
+    loan_count, defaulted_count = get_loan_stats(user)
+    if loan_count == 0:
+        return 0.0
+    return defaulted_count / loan_count
+
+def calculate_activity_score(profile):
+    """Calculate M-Pesa activity score"""
+    return ACTIVITY_SCORES.get(getattr(profile, 'mpesa_activity_level', 'medium'), 0.5)
+
+def compute_features(user):
+    """Compute the feature dict used for both training and serving"""
+    profile = user.profile
+
+    return {
+        'avg_monthly_volume': float(getattr(profile, 'avg_monthly_volume', 0)),
+        'transaction_consistency': getattr(profile, 'transaction_consistency', 0.5),
+        'business_age_months': getattr(user, 'business_age_months', 0),
+        'savings_ratio': getattr(profile, 'savings_ratio', 0),
+        'loan_history_count': get_loan_stats(user)[0],
+        'default_rate': calculate_default_rate(user),
+        'mpesa_activity_score': calculate_activity_score(profile),
+        'customer_rating': getattr(profile, 'customer_rating', 3.0) or 3.0,
+        'transaction_count_30d': getattr(profile, 'transaction_count_30d', 0),
+        'income_consistency_score': getattr(profile, 'income_consistency_score', 0.5),
+        'has_regular_income': 1 if getattr(profile, 'has_regular_income', False) else 0,
+        'negative_balance_days': getattr(profile, 'negative_balance_days', 0)  # Not tracked on UserProfile yet
+    }
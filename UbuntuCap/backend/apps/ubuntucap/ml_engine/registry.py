@@ -0,0 +1,180 @@
+import joblib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from .features import FEATURE_NAMES, FEATURE_VERSION
+from .compiled_ensemble import CompiledEnsemble
+
+logger = logging.getLogger(__name__)
+
+class ModelRegistry:
+    """Immutable model versions plus an atomically swapped pointer to the live one.
+
+    Each version is a directory under versions/ holding the model (pickled
+    and uncompressed for mmap), the compiled ensemble when supported, the
+    scaler, metadata.json and schema.json. A version directory is written
+    under a temporary name and renamed into place complete, and is never
+    modified afterwards. current.json names the live version and the one
+    it replaced; promoting or rolling back rewrites only that file with
+    os.replace, so readers see either the old or the new version, never
+    a mix.
+    """
+
+    POINTER = 'current.json'
+    SHADOW_POINTER = 'shadow.json'
+
+    def __init__(self, models_dir):
+        self.models_dir = models_dir
+        self.versions_dir = os.path.join(models_dir, 'versions')
+        self.pointer_path = os.path.join(models_dir, self.POINTER)
+        self.shadow_pointer_path = os.path.join(models_dir, self.SHADOW_POINTER)
+
+    def version_dir(self, version):
+        return os.path.join(self.versions_dir, version)
+
+    def read_pointer(self):
+        try:
+            with open(self.pointer_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def current_version(self):
+        pointer = self.read_pointer()
+        return pointer['version'] if pointer else None
+
+    def list_versions(self):
+        if not os.path.isdir(self.versions_dir):
+            return []
+        return sorted(name for name in os.listdir(self.versions_dir) if not name.startswith('.'))
+
+    def create_version(self, model, scaler, metadata):
+        """Write a complete new version directory and return its id"""
+        version = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+        tmp_dir = os.path.join(self.versions_dir, f'.tmp-{version}')
+        os.makedirs(tmp_dir)
+
+        try:
+            joblib.dump(model, os.path.join(tmp_dir, 'model.pkl'))
+            # Uncompressed copy that workers load with mmap_mode='r'
+            joblib.dump(model, os.path.join(tmp_dir, 'model_mmap.joblib'), compress=0)
+            if CompiledEnsemble.supports(model):
+                CompiledEnsemble.from_model(model).save(os.path.join(tmp_dir, 'compiled.joblib'))
+            joblib.dump(scaler, os.path.join(tmp_dir, 'scaler.pkl'))
+
+            with open(os.path.join(tmp_dir, 'metadata.json'), 'w') as f:
+                json.dump({**metadata, 'version': version}, f, indent=2)
+            with open(os.path.join(tmp_dir, 'schema.json'), 'w') as f:
+                json.dump({'features': list(FEATURE_NAMES), 'feature_version': FEATURE_VERSION}, f, indent=2)
+
+            os.rename(tmp_dir, self.version_dir(version))
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        logger.info(f"📦 Registered model version {version}")
+        return version
+
+    def promote(self, version):
+        """Make a version live by swapping the pointer"""
+        if not os.path.isdir(self.version_dir(version)):
+            raise ValueError(f"Unknown model version: {version}")
+
+        current = self.current_version()
+        if current == version:
+            return version
+
+        tmp_path = f"{self.pointer_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': version,
+                'previous': current,
+                'promoted_at': datetime.now().isoformat()
+            }, f, indent=2)
+        os.replace(tmp_path, self.pointer_path)
+
+        logger.info(f"🚀 Promoted model version {version} (was {current})")
+        return version
+
+    def shadow_version(self):
+        """Candidate version scored in shadow mode next to the live one, if any"""
+        try:
+            with open(self.shadow_pointer_path) as f:
+                return json.load(f)['version']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set_shadow(self, version):
+        if not os.path.isdir(self.version_dir(version)):
+            raise ValueError(f"Unknown model version: {version}")
+
+        tmp_path = f"{self.shadow_pointer_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': version, 'started_at': datetime.now().isoformat()}, f, indent=2)
+        os.replace(tmp_path, self.shadow_pointer_path)
+        logger.info(f"👥 Shadow scoring with model version {version}")
+        return version
+
+    def clear_shadow(self):
+        try:
+            os.remove(self.shadow_pointer_path)
+        except FileNotFoundError:
+            pass
+
+    def rollback(self):
+        """Point back at the version the current one replaced"""
+        pointer = self.read_pointer()
+        if not pointer or not pointer.get('previous'):
+            raise ValueError("No previous model version to roll back to")
+        return self.promote(pointer['previous'])
+
+    def prune(self, keep=10):
+        """Delete the oldest versions beyond keep, never the live, previous or shadow one"""
+        pointer = self.read_pointer() or {}
+        protected = {pointer.get('version'), pointer.get('previous'), self.shadow_version()}
+        versions = self.list_versions()
+
+        removed = []
+        for version in versions[:max(0, len(versions) - keep)]:
+            if version not in protected:
+                shutil.rmtree(self.version_dir(version), ignore_errors=True)
+                removed.append(version)
+        return removed
+
+    def read_metadata(self, version=None):
+        version = version or self.current_version()
+        if version is None:
+            return None
+        with open(os.path.join(self.version_dir(version), 'metadata.json')) as f:
+            return json.load(f)
+
+    def load(self, version=None, use_mmap=True, use_compiled=True):
+        """Return (model, scaler, compiled or None, version) for a version, the live one by default"""
+        version = self.resolve(version)
+        compiled = self.load_compiled(version, use_mmap) if use_compiled else None
+        return self.load_model(version, use_mmap), self.load_scaler(version), compiled, version
+
+    def resolve(self, version=None):
+        version = version or self.current_version()
+        if version is None:
+            raise ValueError("No model version has been promoted")
+        return version
+
+    def load_model(self, version, use_mmap=True):
+        """The sklearn model. Its tree arrays are copied on unpickle even with mmap"""
+        path = self.version_dir(version)
+        if use_mmap:
+            return joblib.load(os.path.join(path, 'model_mmap.joblib'), mmap_mode='r')
+        return joblib.load(os.path.join(path, 'model.pkl'))
+
+    def load_compiled(self, version, use_mmap=True):
+        """The compiled ensemble, or None for models that can't be compiled"""
+        compiled_path = os.path.join(self.version_dir(version), 'compiled.joblib')
+        if not os.path.exists(compiled_path):
+            return None
+        return CompiledEnsemble.load(compiled_path, mmap_mode='r' if use_mmap else None)
+
+    def load_scaler(self, version):
+        return joblib.load(os.path.join(self.version_dir(version), 'scaler.pkl'))
@@ -0,0 +1,40 @@
+import numpy as np
+from .features import FEATURE_NAMES
+
+BASE_SCORE = 50
+
+# Rule-based scoring bands: (component, feature, comparison, thresholds, points).
+# Thresholds are ascending and points has one more entry than thresholds.
+# 'gt' moves up a band once the value is strictly above a threshold,
+# 'ge' once it reaches it.
+SCORE_BANDS = [
+    ('volume_score', 'avg_monthly_volume', 'gt', [10000, 25000, 50000, 100000], [0, 5, 10, 15, 20]),
+    ('business_age_score', 'business_age_months', 'gt', [6, 12, 24], [0, 5, 10, 15]),
+    ('consistency_score', 'transaction_consistency', 'gt', [0.4, 0.6, 0.8], [0, 5, 10, 15]),
+    ('savings_score', 'savings_ratio', 'gt', [0.1, 0.2], [0, 5, 10]),
+    ('activity_score', 'mpesa_activity_score', 'ge', [0.5, 0.7, 0.9], [0, 4, 7, 10]),
+    ('loan_history_score', 'loan_history_count', 'gt', [0, 2, 5], [0, 4, 7, 10]),
+    ('default_penalty', 'default_rate', 'gt', [0, 0.1, 0.3, 0.5], [0, -5, -10, -15, -20]),
+    ('rating_score', 'customer_rating', 'ge', [3.0, 3.5, 4.0, 4.5], [0, 2, 4, 7, 10]),
+]
+
+_COMPILED_BANDS = [
+    (component, FEATURE_NAMES.index(feature), 'left' if comparison == 'gt' else 'right',
+     np.asarray(thresholds, dtype=float), np.asarray(points))
+    for component, feature, comparison, thresholds, points in SCORE_BANDS
+]
+
+def score_features(feature_matrix):
+    """Score a matrix of feature rows (columns in FEATURE_NAMES order).
+
+    Returns (final_scores, components) where components maps each band
+    name to the points awarded per row.
+    """
+    X = np.atleast_2d(np.asarray(feature_matrix, dtype=float))
+
+    components = {}
+    for component, column, side, thresholds, points in _COMPILED_BANDS:
+        components[component] = points[np.searchsorted(thresholds, X[:, column], side=side)]
+
+    total = BASE_SCORE + sum(components.values())
+    return np.clip(total, 0, 100), components
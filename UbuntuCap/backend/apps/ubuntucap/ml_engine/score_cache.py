@@ -0,0 +1,71 @@
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ScoreCache:
+    """Credit score cache keyed by user id and model version.
+
+    Entries store the model version they were computed with, so a model
+    reload turns every older entry into a miss without a global flush.
+    Eviction (LRU/TTL) is left to the configured cache backend, which must
+    be shared (CREDIT_SCORE_CACHE_URL) for invalidations to reach every
+    process.
+    """
+
+    def __init__(self, alias='credit_scores'):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        try:
+            return caches[self.alias]
+        except InvalidCacheBackendError:
+            return caches['default']
+
+    def _key(self, user_id):
+        return f"credit_score:{user_id}"
+
+    def _record(self, hits=0, misses=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get(self, user_id, model_version):
+        entry = self.cache.get(self._key(user_id))
+        if entry is not None and entry[0] == model_version:
+            self._record(hits=1)
+            return entry[1]
+        self._record(misses=1)
+        return None
+
+    def set(self, user_id, model_version, score):
+        self.cache.set(self._key(user_id), (model_version, float(score)))
+
+    def set_many(self, scores, model_version):
+        self.cache.set_many({
+            self._key(user_id): (model_version, float(score))
+            for user_id, score in scores.items()
+        })
+
+    def invalidate(self, user_id):
+        self.cache.delete(self._key(user_id))
+
+    def invalidate_many(self, user_ids):
+        self.cache.delete_many([self._key(user_id) for user_id in user_ids])
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+score_cache = ScoreCache()
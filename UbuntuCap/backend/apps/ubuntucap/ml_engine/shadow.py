@@ -0,0 +1,121 @@
+import numpy as np
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Score delta (shadow - live) histogram bin edges, in score points
+DELTA_BINS = [-100, -20, -10, -5, -2, -1, 1, 2, 5, 10, 20, 100]
+
+class ShadowScorer:
+    """Scores live feature vectors with a candidate model off the request path.
+
+    Requests only enqueue the feature rows and the live scores with
+    put_nowait; a background thread loads the candidate with load_fn,
+    then scores everything queued so far in one call and folds the
+    differences into a fixed-bin histogram. When the queue is full rows
+    are dropped and counted rather than blocking the request.
+    """
+
+    def __init__(self, version, load_fn, score_fn, max_queue=10000):
+        self.version = version
+        self.artifacts = None
+        self.load_fn = load_fn
+        self.score_fn = score_fn
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._stopped = threading.Event()
+        self.histogram = np.zeros(len(DELTA_BINS) - 1, dtype=np.int64)
+        self.scored = 0
+        self.dropped = 0
+        self.delta_sum = 0.0
+        self.abs_delta_sum = 0.0
+
+    def _ensure_started(self):
+        # Threads don't survive a fork, so each worker process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            thread = threading.Thread(target=self._run, args=(self._queue,), name='credit-score-shadow', daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, feature_matrix, live_scores):
+        if self._stopped.is_set():
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((np.asarray(feature_matrix, dtype=float), np.asarray(live_scores, dtype=float)))
+        except queue.Full:
+            self.dropped += len(live_scores)
+
+    def stop(self):
+        """Ask the scoring thread to exit, without ever blocking the caller"""
+        self._stopped.set()
+        if self._queue is not None and self._pid == os.getpid():
+            # Wake the thread if it is idle; a full queue means it is busy
+            # and will see the event after its current batch
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def _run(self, pending):
+        if self.artifacts is None:
+            try:
+                self.artifacts = self.load_fn()
+                logger.info(f"👥 Loaded shadow model version {self.version}")
+            except Exception as e:
+                logger.error(f"Could not load shadow model version {self.version}: {e}")
+                self._stopped.set()
+                return
+
+        while True:
+            items = [pending.get()]
+            while True:
+                try:
+                    items.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            items = [item for item in items if item is not None]
+            if items:
+                self._score(items)
+            if self._stopped.is_set():
+                return
+
+    def _score(self, items):
+        try:
+            feature_matrix = np.vstack([features for features, _ in items])
+            live_scores = np.concatenate([scores for _, scores in items])
+            deltas = self.score_fn(feature_matrix, self.artifacts) - live_scores
+        except Exception as e:
+            logger.error(f"Shadow scoring failed for version {self.version}: {e}")
+            return
+
+        counts, _ = np.histogram(np.clip(deltas, DELTA_BINS[0], DELTA_BINS[-1]), bins=DELTA_BINS)
+        self.histogram += counts
+        self.scored += len(deltas)
+        self.delta_sum += float(deltas.sum())
+        self.abs_delta_sum += float(np.abs(deltas).sum())
+
+    def stats(self):
+        scored = self.scored
+        return {
+            'version': self.version,
+            'scored': scored,
+            'dropped': self.dropped,
+            'mean_delta': round(self.delta_sum / scored, 3) if scored else None,
+            'mean_abs_delta': round(self.abs_delta_sum / scored, 3) if scored else None,
+            'delta_histogram': [
+                {'from': low, 'to': high, 'count': int(count)}
+                for low, high, count in zip(DELTA_BINS[:-1], DELTA_BINS[1:], self.histogram)
+            ]
+        }
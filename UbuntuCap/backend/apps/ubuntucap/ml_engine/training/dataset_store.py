@@ -0,0 +1,99 @@
+import pandas as pd
+import numpy as np
+import json
+import logging
+import os
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+class DatasetStore:
+    """Versioned training snapshots with a JSON manifest.
+
+    Each snapshot is written once as Parquet when pyarrow is installed,
+    otherwise as a single uncompressed .npy matrix (columns listed in the
+    manifest) that is loaded memory-mapped. The manifest records every
+    snapshot's file, format, row count, column schema and source, and
+    which snapshot is the latest, so a retraining run can reload data by
+    name instead of hitting the database again.
+    """
+
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, data_dir):
+        self.root = os.path.join(data_dir, 'datasets')
+        os.makedirs(self.root, exist_ok=True)
+        self.manifest_path = os.path.join(self.root, self.MANIFEST)
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'latest': None, 'datasets': {}}
+
+    def _write_manifest(self, manifest):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def list(self):
+        return self._read_manifest()['datasets']
+
+    def save(self, df, source, name=None, mark_latest=True, **extra):
+        """Write a DataFrame of numeric columns as a new snapshot and return its name"""
+        name = name or f"{source}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        columns = [str(column) for column in df.columns]
+
+        if PARQUET_AVAILABLE:
+            file_format, filename = 'parquet', f'{name}.parquet'
+            df.to_parquet(os.path.join(self.root, filename), index=False)
+        else:
+            file_format, filename = 'npy', f'{name}.npy'
+            np.save(os.path.join(self.root, filename), df.to_numpy(dtype=np.float64))
+
+        manifest = self._read_manifest()
+        manifest['datasets'][name] = {
+            'file': filename,
+            'format': file_format,
+            'rows': len(df),
+            'columns': columns,
+            'source': source,
+            'created_at': datetime.now().isoformat(),
+            **extra
+        }
+        if mark_latest:
+            manifest['latest'] = name
+        self._write_manifest(manifest)
+        df.attrs['dataset'] = name
+
+        logger.info(f"💾 Saved dataset {name} ({len(df)} rows, {file_format})")
+        return name
+
+    def load(self, name='latest', mmap=True):
+        """Load a snapshot by name ('latest' for the most recent one)"""
+        manifest = self._read_manifest()
+        if name == 'latest':
+            name = manifest['latest']
+        if name not in manifest['datasets']:
+            raise KeyError(f"Unknown dataset: {name}")
+
+        entry = manifest['datasets'][name]
+        path = os.path.join(self.root, entry['file'])
+
+        if entry['format'] == 'parquet':
+            df = pd.read_parquet(path, memory_map=mmap)
+        else:
+            matrix = np.load(path, mmap_mode='r' if mmap else None)
+            df = pd.DataFrame(matrix, columns=entry['columns'], copy=False)
+
+        df.attrs['dataset'] = name
+        logger.info(f"📂 Loaded dataset {name} ({len(df)} rows)")
+        return df
@@ -0,0 +1,274 @@
+import fcntl
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import uuid
+from datetime import datetime
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# train_model options a job may set: (command-line flag, type, allowed values or None)
+TRAINING_OPTIONS = {
+    'synthetic': ('--synthetic', bool, None),
+    'samples': ('--samples', int, range(1, 1000001)),
+    'seed': ('--seed', int, None),
+    'workers': ('--workers', int, None),
+    'search': ('--search', str, ('random', 'halving')),
+    'trials': ('--trials', int, range(1, 1001)),
+    'incremental': ('--incremental', bool, None),
+    'dataset': ('--dataset', str, None),
+    'no_promote': ('--no-promote', bool, None),
+}
+
+# A queued job that hasn't reported a pid within this many seconds is considered dead
+QUEUED_TIMEOUT = 60
+
+class TrainingJobConflict(Exception):
+    """Raised when a training job is already queued or running"""
+
+    def __init__(self, job):
+        super().__init__(f"Training job {job['job_id']} is already {job['status']}")
+        self.job = job
+
+def validate_options(options):
+    """Check and coerce request options for train_model, raising ValueError on bad input"""
+    if options is None:
+        return {}
+    if not isinstance(options, dict):
+        raise ValueError('Training options must be a JSON object')
+
+    unknown = sorted(set(options) - set(TRAINING_OPTIONS))
+    if unknown:
+        raise ValueError(f"Unknown training options: {', '.join(unknown)}")
+
+    cleaned = {}
+    for key, value in options.items():
+        _, option_type, allowed = TRAINING_OPTIONS[key]
+        if value is None:
+            continue
+        if option_type is bool:
+            if not isinstance(value, bool):
+                raise ValueError(f"'{key}' must be true or false")
+        elif option_type is int:
+            # bool is an int subclass, but true/false is never a valid count
+            if isinstance(value, bool):
+                raise ValueError(f"'{key}' must be an integer")
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"'{key}' must be an integer")
+        elif not isinstance(value, str) or not value:
+            raise ValueError(f"'{key}' must be a non-empty string")
+
+        if isinstance(allowed, tuple) and value not in allowed:
+            raise ValueError(f"'{key}' must be one of {list(allowed)}")
+        if isinstance(allowed, range) and value not in allowed:
+            raise ValueError(f"'{key}' must be between {allowed.start} and {allowed.stop - 1}")
+        cleaned[key] = value
+
+    # -1 means all cores; anything else must fit on this machine
+    workers = cleaned.get('workers')
+    cores = os.cpu_count() or 1
+    if workers is not None and workers != -1 and not 1 <= workers <= cores:
+        raise ValueError(f"'workers' must be -1 (all cores) or between 1 and {cores}")
+    return cleaned
+
+class TrainingJobRunner:
+    """Runs train_model in a separate process and tracks it in ml_models/jobs.
+
+    Each job is a JSON state file (queued -> running -> done/failed, with
+    timings and metrics) written atomically by the web process and by the
+    training process itself, under an flock so their updates never
+    overwrite each other. A lock file created with O_EXCL allows one job
+    at a time. Reading a queued or running job whose process has died
+    marks it failed and releases the lock.
+    """
+
+    def __init__(self, models_dir=None):
+        models_dir = models_dir or os.path.join(settings.BASE_DIR, 'ml_models')
+        self.jobs_dir = os.path.join(models_dir, 'jobs')
+        self.lock_path = os.path.join(self.jobs_dir, 'training.lock')
+        self.state_lock_path = os.path.join(self.jobs_dir, 'state.lock')
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, f'{job_id}.json')
+
+    def _read(self, job_id):
+        try:
+            with open(self._job_path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, job_id):
+        """Job state, with a queued or running job whose process has died marked failed"""
+        job = self._read(job_id)
+        if job and job['status'] in ('queued', 'running') and not self._is_alive(job):
+            job = self._fail_if_dead(job_id)
+        return job
+
+    def _fail_if_dead(self, job_id):
+        # Re-checked under the state lock: the job may have finished since it was read
+        with open(self.state_lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            job = self._read(job_id)
+            if not job or job['status'] not in ('queued', 'running') or self._is_alive(job):
+                return job
+            job.update(status='failed', error='Training process exited unexpectedly',
+                       finished_at=datetime.now().isoformat())
+            self._save(job)
+
+        logger.warning(f"⚠️ Training job {job_id} exited without reporting a result")
+        self.release_lock(job_id)
+        return job
+
+    def latest(self):
+        jobs = [name[:-5] for name in os.listdir(self.jobs_dir) if name.endswith('.json')]
+        found = [self.get(job_id) for job_id in jobs]
+        found = [job for job in found if job]
+        return max(found, key=lambda job: job['created_at']) if found else None
+
+    def _save(self, job):
+        tmp_path = f"{self._job_path(job['job_id'])}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f, indent=2)
+        os.replace(tmp_path, self._job_path(job['job_id']))
+        return job
+
+    def _update(self, job_id, **fields):
+        # The web and training processes both update the file, so serialise read-modify-write
+        with open(self.state_lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            job = self._read(job_id) or {'job_id': job_id, 'created_at': datetime.now().isoformat()}
+            job.update(fields)
+            return self._save(job)
+
+    def _is_alive(self, job):
+        if job['status'] == 'queued' and not job.get('pid'):
+            age = datetime.now() - datetime.fromisoformat(job['created_at'])
+            return age.total_seconds() < QUEUED_TIMEOUT
+        if job['status'] not in ('queued', 'running') or not job.get('pid'):
+            return False
+        try:
+            os.kill(job['pid'], 0)
+            return True
+        except OSError:
+            return False
+
+    def _acquire_lock(self, job_id):
+        for _ in range(2):
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    with open(self.lock_path) as f:
+                        holder_id = f.read().strip()
+                except FileNotFoundError:
+                    continue
+                holder = self.get(holder_id)
+                if holder and holder['status'] in ('queued', 'running'):
+                    raise TrainingJobConflict(holder)
+
+                # Stale lock: the process that held it is gone
+                self.release_lock(holder_id)
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(job_id)
+            return
+        raise TrainingJobConflict(self.latest())
+
+    def release_lock(self, job_id):
+        try:
+            with open(self.lock_path) as f:
+                if f.read().strip() != job_id:
+                    return
+            os.remove(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+    def submit(self, options=None, requested_by=None):
+        """Queue a training job and start it in a background process"""
+        options = validate_options(options)
+        job_id = uuid.uuid4().hex[:12]
+        self._acquire_lock(job_id)
+
+        job = self._save({
+            'job_id': job_id,
+            'status': 'queued',
+            'options': options,
+            'requested_by': requested_by,
+            'created_at': datetime.now().isoformat(),
+            'log_file': os.path.join(self.jobs_dir, f'{job_id}.log')
+        })
+
+        command = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'train_model', '--job-id', job_id]
+        for key, value in options.items():
+            flag = TRAINING_OPTIONS[key][0]
+            if value is True:
+                command.append(flag)
+            elif value is not False:
+                command.extend([flag, str(value)])
+
+        try:
+            with open(job['log_file'], 'w') as log:
+                process = subprocess.Popen(
+                    command, cwd=settings.BASE_DIR, stdout=log, stderr=subprocess.STDOUT,
+                    stdin=subprocess.DEVNULL, start_new_session=True
+                )
+        except Exception as e:
+            self.mark_failed(job_id, f"Could not start training process: {e}")
+            raise
+
+        # Reap the child when it exits, so a dead job never looks alive as a zombie
+        threading.Thread(target=process.wait, name=f'training-job-{job_id}', daemon=True).start()
+
+        logger.info(f"🧵 Started training job {job_id} (pid {process.pid})")
+        return self._update(job_id, pid=process.pid)
+
+    def start_local(self, options=None, requested_by=None):
+        """Record a train_model run started outside the job API, under the same one-job lock"""
+        job_id = uuid.uuid4().hex[:12]
+        self._acquire_lock(job_id)
+
+        now = datetime.now().isoformat()
+        return self._save({
+            'job_id': job_id,
+            'status': 'running',
+            'options': options or {},
+            'requested_by': requested_by,
+            'pid': os.getpid(),
+            'created_at': now,
+            'started_at': now
+        })
+
+    def mark_running(self, job_id):
+        return self._update(job_id, status='running', pid=os.getpid(), started_at=datetime.now().isoformat())
+
+    def mark_finished(self, job_id, result):
+        if not result:
+            return self.mark_failed(job_id, 'Training failed')
+
+        job = self._read(job_id) or {}
+        finished_at = datetime.now()
+        started_at = job.get('started_at')
+        try:
+            return self._update(
+                job_id,
+                status='done',
+                finished_at=finished_at.isoformat(),
+                duration_seconds=(finished_at - datetime.fromisoformat(started_at)).total_seconds() if started_at else None,
+                result=result
+            )
+        finally:
+            self.release_lock(job_id)
+
+    def mark_failed(self, job_id, error):
+        try:
+            return self._update(job_id, status='failed', error=error, finished_at=datetime.now().isoformat())
+        finally:
+            self.release_lock(job_id)
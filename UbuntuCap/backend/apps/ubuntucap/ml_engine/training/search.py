@@ -0,0 +1,244 @@
+import pandas as pd
+import numpy as np
+import json
+import logging
+import math
+import os
+import time
+from datetime import datetime
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.model_selection import KFold
+from sklearn.metrics import r2_score
+
+logger = logging.getLogger(__name__)
+
+# Parameter space per model family: (estimator class, fixed params, sampled params)
+SEARCH_SPACES = {
+    'random_forest': (RandomForestRegressor, {'random_state': 42}, {
+        'n_estimators': [50, 100, 200, 400],
+        'max_depth': [None, 6, 10, 16],
+        'min_samples_leaf': [1, 2, 5, 10],
+        'max_features': [1.0, 0.5, 'sqrt'],
+    }),
+    'gradient_boosting': (GradientBoostingRegressor, {'random_state': 42}, {
+        'n_estimators': [50, 100, 200, 400],
+        'learning_rate': [0.03, 0.05, 0.1, 0.2],
+        'max_depth': [2, 3, 4, 5],
+        'subsample': [0.7, 0.85, 1.0],
+    }),
+    'linear_regression': (LinearRegression, {}, {
+        'fit_intercept': [True, False],
+    }),
+}
+
+# Single-row predictions timed per trial to estimate p99 latency
+LATENCY_SAMPLES = 200
+LATENCY_WARMUP = 20
+LATENCY_REPEATS = 3
+
+def _single_row_p99(model, X):
+    """p99 single-row latency in ms, through the compiled evaluator when serving would use it"""
+    from apps.ubuntucap.ml_engine.compiled_ensemble import CompiledEnsemble
+
+    predict = CompiledEnsemble.from_model(model).predict if CompiledEnsemble.supports(model) else model.predict
+    # Untimed warm-up so first-call allocation doesn't land in the tail
+    for i in range(min(LATENCY_WARMUP, len(X))):
+        predict(X[i:i + 1])
+    timings = np.empty(min(LATENCY_SAMPLES, len(X)))
+    # Best of several passes, like timeit, so a burst of background work
+    # (pool workers winding down) doesn't decide the result
+    p99s = []
+    for _ in range(LATENCY_REPEATS):
+        for i in range(len(timings)):
+            started = time.perf_counter()
+            predict(X[i:i + 1])
+            timings[i] = time.perf_counter() - started
+        p99s.append(np.percentile(timings, 99))
+    return float(min(p99s) * 1000)
+
+def _run_fold(estimator, X, y, train_idx, val_idx, keep_model):
+    """Fit and score one trial on one fold (runs in a joblib worker)"""
+    started = time.perf_counter()
+    estimator.fit(X[train_idx], y[train_idx])
+    fit_seconds = time.perf_counter() - started
+    score = r2_score(y[val_idx], estimator.predict(X[val_idx]))
+    return score, fit_seconds, estimator if keep_model else None
+
+class HyperparameterSearch:
+    """Randomized and successive-halving search over SEARCH_SPACES.
+
+    CV folds are computed once and shared by every trial. Trials are
+    ranked by an objective of mean CV R² minus a penalty for p99
+    single-row latency above latency_budget_ms, so a slightly less
+    accurate model that meets the scoring budget beats one that doesn't.
+    Latency is timed serially on each trial's fold-0 model after the
+    parallel fits have finished, never alongside them.
+    """
+
+    def __init__(self, X, y, families=None, cv=5, n_jobs=1, latency_budget_ms=None,
+                 latency_penalty=1.0, prune_margin=0.05, random_state=42):
+        self.X = np.asarray(X, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.families = list(families or SEARCH_SPACES)
+        self.n_jobs = n_jobs
+        self.latency_budget_ms = latency_budget_ms
+        self.latency_penalty = latency_penalty
+        self.prune_margin = prune_margin
+        self.rng = np.random.default_rng(random_state)
+        # Training indices are shuffled so any prefix is a random subsample (successive halving)
+        self.folds = [
+            (self.rng.permutation(train_idx), val_idx)
+            for train_idx, val_idx in KFold(n_splits=cv, shuffle=True, random_state=random_state).split(self.X)
+        ]
+        self.run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.strategy = None
+        self.trials = []
+
+    def objective(self, r2, p99_ms):
+        if not self.latency_budget_ms or p99_ms is None:
+            return r2
+        return r2 - self.latency_penalty * max(0.0, p99_ms / self.latency_budget_ms - 1)
+
+    def _new_trial(self, family):
+        _, _, space = SEARCH_SPACES[family]
+        params = {name: values[self.rng.integers(len(values))] for name, values in space.items()}
+        trial = {
+            'trial_id': len(self.trials),
+            'family': family,
+            'params': params,
+            'round': 0,
+            'rows': 0,
+            'fold_scores': [],
+            'fit_seconds': 0.0,
+            'p99_ms': None,
+            'pruned': False
+        }
+        self.trials.append(trial)
+        return trial
+
+    def _estimator(self, trial):
+        estimator_class, fixed, _ = SEARCH_SPACES[trial['family']]
+        return estimator_class(**fixed, **trial['params'])
+
+    def _evaluate(self, trials, fold_ids, rows=None):
+        """Run the given folds of the given trials as one flat parallel batch"""
+        tasks = []
+        for trial in trials:
+            for fold in fold_ids:
+                train_idx, val_idx = self.folds[fold]
+                if rows is not None:
+                    train_idx = train_idx[:rows]
+                tasks.append((trial, fold, train_idx, val_idx))
+
+        outcomes = Parallel(n_jobs=self.n_jobs)(
+            delayed(_run_fold)(self._estimator(trial), self.X, self.y, train_idx, val_idx, fold == 0)
+            for trial, fold, train_idx, val_idx in tasks
+        )
+
+        fitted = []
+        for (trial, fold, train_idx, val_idx), (score, fit_seconds, model) in zip(tasks, outcomes):
+            trial['fold_scores'].append(score)
+            trial['fit_seconds'] += fit_seconds
+            trial['rows'] = len(train_idx)
+            if model is not None:
+                fitted.append((trial, model, val_idx))
+        
+        # Timed one trial at a time once the pool is idle, so other fits don't
+        # inflate the numbers
+        for trial, model, val_idx in fitted:
+            trial['p99_ms'] = _single_row_p99(model, self.X[val_idx])
+
+    def _score(self, trial):
+        return self.objective(float(np.mean(trial['fold_scores'])), trial['p99_ms'])
+
+    def random_search(self, n_trials=20):
+        """Sample n_trials configurations and evaluate them fold by fold.
+
+        After each fold, trials whose running objective trails the best one
+        by more than prune_margin are stopped early.
+        """
+        self.strategy = 'random'
+        live = [self._new_trial(self.families[i % len(self.families)]) for i in range(n_trials)]
+
+        for fold in range(len(self.folds)):
+            self._evaluate(live, [fold])
+            best = max(self._score(trial) for trial in live)
+            for trial in live:
+                if self._score(trial) < best - self.prune_margin:
+                    trial['pruned'] = True
+            live = [trial for trial in live if not trial['pruned']]
+            logger.info(f"   🔎 Fold {fold + 1}/{len(self.folds)}: {len(live)} trials still running")
+
+        return self.best_trials()
+
+    def successive_halving(self, n_candidates=27, factor=3, min_rows=None):
+        """Evaluate many configurations on few rows, keeping the best 1/factor each round"""
+        self.strategy = 'halving'
+        live = [self._new_trial(self.families[i % len(self.families)]) for i in range(n_candidates)]
+
+        max_rows = min(len(train_idx) for train_idx, _ in self.folds)
+        n_rounds = max(1, math.ceil(math.log(n_candidates, factor)))
+        min_rows = min_rows or max(100, max_rows // factor ** (n_rounds - 1))
+
+        for round_number in range(n_rounds):
+            rows = min(max_rows, min_rows * factor ** round_number)
+            for trial in live:
+                # Scores from smaller rounds aren't comparable with this one
+                trial['fold_scores'] = []
+                trial['round'] = round_number
+            self._evaluate(live, range(len(self.folds)), rows=rows)
+
+            live.sort(key=self._score, reverse=True)
+            keep = max(1, len(live) // factor) if round_number < n_rounds - 1 else len(live)
+            for trial in live[keep:]:
+                trial['pruned'] = True
+            live = live[:keep]
+            logger.info(f"   🔎 Round {round_number + 1}/{n_rounds} on {rows} rows: kept {len(live)} trials")
+
+        return self.best_trials()
+
+    def best_trials(self):
+        """Best trial per family: furthest round reached, then objective"""
+        best = {}
+        for trial in self.trials:
+            if not trial['fold_scores']:
+                continue
+            key = (trial['round'], not trial['pruned'], self._score(trial))
+            current = best.get(trial['family'])
+            if current is None or key > (current['round'], not current['pruned'], self._score(current)):
+                best[trial['family']] = trial
+        return best
+
+    def best_models(self):
+        """Unfitted estimators configured with each family's best parameters"""
+        return {family: self._estimator(trial) for family, trial in self.best_trials().items()}
+
+    def results_table(self):
+        return pd.DataFrame([
+            {
+                'run_id': self.run_id,
+                'strategy': self.strategy,
+                'trial_id': trial['trial_id'],
+                'family': trial['family'],
+                'params': json.dumps(trial['params']),
+                'round': trial['round'],
+                'rows': trial['rows'],
+                'folds': len(trial['fold_scores']),
+                'cv_mean': np.mean(trial['fold_scores']) if trial['fold_scores'] else None,
+                'cv_std': np.std(trial['fold_scores']) if trial['fold_scores'] else None,
+                'p99_ms': trial['p99_ms'],
+                'objective': self._score(trial) if trial['fold_scores'] else None,
+                'fit_seconds': round(trial['fit_seconds'], 3),
+                'pruned': trial['pruned']
+            }
+            for trial in self.trials
+        ])
+
+    def save_results(self, path):
+        """Append this run's trials to the results table"""
+        table = self.results_table()
+        table.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+        logger.info(f"📋 Saved {len(table)} search trials to {path}")
+        return path
@@ -4,18 +4,37 @@ import joblib
 import json
 from datetime import datetime, timedelta
 from django.conf import settings
+from django.db.models import Q
 from django.utils import timezone
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.linear_model import LinearRegression, SGDRegressor
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split, KFold
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import logging
 import os
+import time
+from joblib import Parallel, delayed
+from apps.ubuntucap.ml_engine.features import FEATURE_NAMES, FEATURE_VERSION
+from apps.ubuntucap.ml_engine.registry import ModelRegistry
+from apps.ubuntucap.ml_engine.training.dataset_store import DatasetStore
 
 logger = logging.getLogger(__name__)
 
+def _fit_and_predict(model, X_fit, y_fit, X_eval):
+    """Fit one candidate (runs in a joblib worker) and return it with its predictions and fit time"""
+    started = time.perf_counter()
+    model.fit(X_fit, y_fit)
+    elapsed = time.perf_counter() - started
+    return model, model.predict(X_eval), elapsed
+
 class MLModelTrainer:
+    # Model types train_incremental can update in place
+    INCREMENTAL_MODELS = ('RandomForestRegressor', 'GradientBoostingRegressor', 'LinearRegression', 'SGDRegressor')
+    # Score bands used for calibration, aligned with the credit risk categories
+    CALIBRATION_BANDS = [0, 50, 60, 70, 80, 100]
+    
     def __init__(self):
         # Get BASE_DIR safely - handle both Django and standalone usage
         try:
@@ -30,69 +49,94 @@ class MLModelTrainer:
         os.makedirs(self.models_dir, exist_ok=True)
         os.makedirs(self.data_dir, exist_ok=True)
         
-        self.features = [
-            'avg_monthly_volume',
-            'transaction_consistency',
-            'business_age_months', 
-            'savings_ratio',
-            'loan_history_count',
-            'default_rate',
-            'mpesa_activity_score',
-            'customer_rating',
-            'transaction_count_30d',
-            'income_consistency_score',
-            'has_regular_income',
-            'negative_balance_days'
-        ]
+        self.features = list(FEATURE_NAMES)
+        self.dataset_store = DatasetStore(self.data_dir)
+        self.registry = ModelRegistry(self.models_dir)
         
         self.target = 'credit_score'
         
-    def collect_training_data(self):
-        """Collect and prepare training data from the database"""
+    def collect_training_data(self, chunk_size=2000, progress=None, since=None):
+        """Collect and prepare training data from the database.
+
+        Users are streamed in chunks of primary keys: stored feature vectors
+        are read with values_list() straight into a preallocated matrix, only
+        missing vectors are built from model instances, and each chunk is
+        scored with a single model call. progress(done, total) is called
+        after every chunk. With since, only users whose feature vector
+        changed after that time (or has none yet) are collected.
+        """
         try:
-            from apps.users.models import User, UserProfile
-            from apps.loans.models import Loan, LoanApplication
+            from apps.users.models import User
+            from apps.ubuntucap.models import CreditFeatureVector
+            from apps.ubuntucap.ml_engine.features import with_loan_stats
+            from apps.ubuntucap.ml_engine.feature_store import load_features
+            from apps.ubuntucap.ml_engine.credit_scorer import get_credit_model
             
             logger.info("📊 Collecting training data from database...")
             
+            # Taken before reading so changes made during collection are picked up next time
+            watermark = timezone.now()
             users = User.objects.all()
-            training_data = []
-            
-            for user in users:
-                try:
-                    profile = user.profile
-                    
-                    # Calculate actual performance metrics
-                    performance_score = self._calculate_actual_performance(user)
-                    
-                    features = {
-                        'avg_monthly_volume': float(profile.avg_monthly_volume),
-                        'transaction_consistency': profile.transaction_consistency,
-                        'business_age_months': user.business_age_months,
-                        'savings_ratio': profile.savings_ratio,
-                        'loan_history_count': user.loans.count(),
-                        'default_rate': self._calculate_default_rate(user),
-                        'mpesa_activity_score': self._calculate_activity_score(profile),
-                        'customer_rating': profile.customer_rating or 3.0,
-                        'transaction_count_30d': profile.transaction_count_30d,
-                        'income_consistency_score': profile.income_consistency_score,
-                        'has_regular_income': 1 if profile.has_regular_income else 0,
-                        'negative_balance_days': profile.negative_balance_days,
-                        'credit_score': performance_score
-                    }
-                    
-                    training_data.append(features)
-                    
-                except Exception as e:
-                    logger.warning(f"Could not process user {user.id}: {e}")
-                    continue
+            if since is not None:
+                users = users.filter(
+                    Q(credit_features__computed_at__gt=since) |
+                    Q(credit_features__isnull=True) |
+                    Q(credit_features__feature_version__lt=FEATURE_VERSION)
+                )
+            
+            total = users.count()
+            X = np.empty((total, len(self.features)), dtype=float)
+            y = np.empty(total, dtype=float)
+            credit_model = get_credit_model()
+            
+            user_ids = users.order_by('pk').values_list('pk', flat=True)[:total].iterator(chunk_size=chunk_size)
+            filled = 0
+            processed = 0
+            
+            for chunk in self._chunked(user_ids, chunk_size):
+                rows = {
+                    row[0]: row[1:]
+                    for row in CreditFeatureVector.objects.filter(
+                        user_id__in=chunk, feature_version=FEATURE_VERSION
+                    ).values_list('user_id', *self.features)
+                }
+                
+                missing = [pk for pk in chunk if pk not in rows]
+                if missing:
+                    users = with_loan_stats(User.objects.filter(pk__in=missing).select_related('profile'))
+                    for pk, features in load_features(users).items():
+                        rows[pk] = [features[name] for name in self.features]
+                
+                start = filled
+                for pk in chunk:
+                    if pk in rows:
+                        X[filled] = rows[pk]
+                        filled += 1
+                    else:
+                        logger.warning(f"Could not process user {pk}")
+                
+                # Target is the current model's score, computed for the whole chunk at once
+                y[start:filled] = credit_model.score_matrix(X[start:filled])
+                
+                processed += len(chunk)
+                logger.info(f"   Collected {filled}/{total} users")
+                if progress:
+                    progress(processed, total)
             
             # Convert to DataFrame
-            df = pd.DataFrame(training_data)
+            df = pd.DataFrame(X[:filled], columns=self.features)
+            df[self.target] = y[:filled]
             
-            # Save raw data
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            df.to_csv(os.path.join(self.data_dir, f'training_data_{timestamp}.csv'), index=False)
+            # Snapshot the collected data so retraining can reuse it
+            if len(df):
+                self.dataset_store.save(
+                    df,
+                    'training_delta' if since is not None else 'training_data',
+                    feature_version=FEATURE_VERSION,
+                    watermark=watermark.isoformat(),
+                    since=since.isoformat() if since is not None else None
+                )
+            df.attrs['watermark'] = watermark.isoformat()
             
             logger.info(f"✅ Collected {len(df)} training samples")
             return df
@@ -101,109 +145,93 @@ class MLModelTrainer:
             logger.error(f"❌ Error collecting training data: {e}")
             return pd.DataFrame()
     
-    def generate_synthetic_data(self, num_samples=1000):
-        """Generate synthetic training data for development"""
+    def _chunked(self, iterable, size):
+        chunk = []
+        for item in iterable:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    
+    def generate_synthetic_data(self, num_samples=1000, save=True, seed=42):
+        """Generate synthetic training data for development, one array per column"""
         logger.info(f"🤖 Generating {num_samples} synthetic training samples...")
         
-        np.random.seed(42)
+        rng = np.random.default_rng(seed)
+        n = num_samples
         
-        synthetic_data = []
-        for i in range(num_samples):
-            # Realistic feature distributions based on Kenyan SME data
-            avg_monthly_volume = np.random.lognormal(9, 1.2)
-            transaction_consistency = np.random.beta(2, 2)
-            business_age_months = np.random.randint(1, 60)
-            savings_ratio = np.random.beta(2, 5)
-            loan_history_count = np.random.poisson(1.5)
-            default_rate = np.random.beta(1, 9)
-            mpesa_activity_score = np.random.beta(3, 2)
-            customer_rating = np.random.normal(3.8, 0.5)
-            transaction_count_30d = np.random.poisson(20)
-            income_consistency = np.random.beta(3, 2)
-            has_regular_income = np.random.choice([0, 1], p=[0.3, 0.7])
-            negative_balance_days = np.random.poisson(2)
-            
-            # Calculate realistic credit score based on features
-            base_score = 50
-            
-            # Positive factors
-            if avg_monthly_volume > 30000:
-                base_score += 15
-            elif avg_monthly_volume > 15000:
-                base_score += 10
-            elif avg_monthly_volume > 5000:
-                base_score += 5
-                
-            if business_age_months > 24:
-                base_score += 10
-            elif business_age_months > 12:
-                base_score += 7
-            elif business_age_months > 6:
-                base_score += 3
-                
-            if transaction_consistency > 0.7:
-                base_score += 8
-            elif transaction_consistency > 0.5:
-                base_score += 4
-                
-            if savings_ratio > 0.1:
-                base_score += 5
-                
-            if customer_rating > 4.0:
-                base_score += 7
-            elif customer_rating > 3.5:
-                base_score += 3
-                
-            # Negative factors
-            if default_rate > 0.3:
-                base_score -= 20
-            elif default_rate > 0.1:
-                base_score -= 10
-                
-            if negative_balance_days > 7:
-                base_score -= 8
-            elif negative_balance_days > 3:
-                base_score -= 4
-                
-            # Add some noise
-            base_score += np.random.normal(0, 3)
-            
-            # Ensure score is between 0-100
-            credit_score = max(0, min(100, base_score))
-            
-            synthetic_data.append({
-                'avg_monthly_volume': avg_monthly_volume,
-                'transaction_consistency': transaction_consistency,
-                'business_age_months': business_age_months,
-                'savings_ratio': savings_ratio,
-                'loan_history_count': loan_history_count,
-                'default_rate': default_rate,
-                'mpesa_activity_score': mpesa_activity_score,
-                'customer_rating': customer_rating,
-                'transaction_count_30d': transaction_count_30d,
-                'income_consistency_score': income_consistency,
-                'has_regular_income': has_regular_income,
-                'negative_balance_days': negative_balance_days,
-                'credit_score': credit_score
-            })
+        # Realistic feature distributions based on Kenyan SME data
+        avg_monthly_volume = rng.lognormal(9, 1.2, n)
+        transaction_consistency = rng.beta(2, 2, n)
+        business_age_months = rng.integers(1, 60, n)
+        savings_ratio = rng.beta(2, 5, n)
+        loan_history_count = rng.poisson(1.5, n)
+        default_rate = rng.beta(1, 9, n)
+        mpesa_activity_score = rng.beta(3, 2, n)
+        customer_rating = rng.normal(3.8, 0.5, n)
+        transaction_count_30d = rng.poisson(20, n)
+        income_consistency = rng.beta(3, 2, n)
+        has_regular_income = (rng.random(n) < 0.7).astype(np.int64)
+        negative_balance_days = rng.poisson(2, n)
         
-        df = pd.DataFrame(synthetic_data)
+        # Calculate realistic credit score based on features
+        base_score = np.full(n, 50.0)
+        
+        # Positive factors
+        base_score += np.select(
+            [avg_monthly_volume > 30000, avg_monthly_volume > 15000, avg_monthly_volume > 5000], [15, 10, 5], 0
+        )
+        base_score += np.select(
+            [business_age_months > 24, business_age_months > 12, business_age_months > 6], [10, 7, 3], 0
+        )
+        base_score += np.select([transaction_consistency > 0.7, transaction_consistency > 0.5], [8, 4], 0)
+        base_score += np.where(savings_ratio > 0.1, 5, 0)
+        base_score += np.select([customer_rating > 4.0, customer_rating > 3.5], [7, 3], 0)
+        
+        # Negative factors
+        base_score -= np.select([default_rate > 0.3, default_rate > 0.1], [20, 10], 0)
+        base_score -= np.select([negative_balance_days > 7, negative_balance_days > 3], [8, 4], 0)
+        
+        # Add some noise
+        base_score += rng.normal(0, 3, n)
+        
+        df = pd.DataFrame({
+            'avg_monthly_volume': avg_monthly_volume,
+            'transaction_consistency': transaction_consistency,
+            'business_age_months': business_age_months,
+            'savings_ratio': savings_ratio,
+            'loan_history_count': loan_history_count,
+            'default_rate': default_rate,
+            'mpesa_activity_score': mpesa_activity_score,
+            'customer_rating': customer_rating,
+            'transaction_count_30d': transaction_count_30d,
+            'income_consistency_score': income_consistency,
+            'has_regular_income': has_regular_income,
+            'negative_balance_days': negative_balance_days,
+            # Ensure score is between 0-100
+            'credit_score': np.clip(base_score, 0, 100)
+        })
         
         # Save synthetic data
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        df.to_csv(os.path.join(self.data_dir, f'synthetic_data_{timestamp}.csv'), index=False)
+        if save:
+            self.dataset_store.save(df, 'synthetic_data', feature_version=FEATURE_VERSION, seed=seed)
         
         logger.info(f"✅ Generated {len(df)} synthetic samples")
         return df
     
-    def train_models(self, use_synthetic=True):
+    def train_models(self, use_synthetic=True, progress=None, dataset=None, samples=1000, seed=42, n_jobs=1,
+                     search=None, n_trials=20, latency_budget_ms=None, promote=True):
         """Train multiple ML models and select the best one"""
         try:
-            # Collect or generate data
-            if use_synthetic:
-                df = self.generate_synthetic_data(1000)
+            # Reuse a stored snapshot, or collect/generate fresh data
+            if dataset:
+                df = self.dataset_store.load(dataset)
+            elif use_synthetic:
+                df = self.generate_synthetic_data(samples, seed=seed)
             else:
-                df = self.collect_training_data()
+                df = self.collect_training_data(progress=progress)
                 
             if df.empty:
                 logger.error("❌ No training data available")
@@ -230,75 +258,128 @@ class MLModelTrainer:
                 'linear_regression': LinearRegression()
             }
             
+            # Replace the default candidates with each family's best searched configuration
+            searcher = None
+            if search:
+                searcher = self._search_hyperparameters(X_train, y_train, search, n_trials, n_jobs, latency_budget_ms, seed)
+                models = searcher.best_models()
+            search_trials = searcher.best_trials() if searcher else {}
+            
             best_model = None
             best_score = -np.inf
+            best_objective = -np.inf
             best_model_name = None
             results = {}
             
-            logger.info("🏋️ Training multiple models...")
+            logger.info(f"🏋️ Training multiple models (n_jobs={n_jobs})...")
             
+            # Every hold-out fit and CV fold is an independent task, so all
+            # of them run in one flat joblib pool instead of nested pools
+            folds = list(KFold(n_splits=5).split(X_train))
+            tasks = []
             for name, model in models.items():
-                # Train model
                 if name == 'linear_regression':
-                    model.fit(X_train_scaled, y_train)
-                    y_pred = model.predict(X_test_scaled)
+                    tasks.append((name, None, model, X_train_scaled, y_train, X_test_scaled, y_test))
                 else:
-                    model.fit(X_train, y_train)
-                    y_pred = model.predict(X_test)
+                    tasks.append((name, None, model, X_train, y_train, X_test, y_test))
+                
+                # Cross-validation (same folds as cross_val_score(cv=5))
+                for fold, (train_idx, val_idx) in enumerate(folds):
+                    tasks.append((
+                        name, fold, clone(model),
+                        X_train.iloc[train_idx], y_train.iloc[train_idx],
+                        X_train.iloc[val_idx], y_train.iloc[val_idx]
+                    ))
+            
+            started = time.perf_counter()
+            outcomes = Parallel(n_jobs=n_jobs)(
+                delayed(_fit_and_predict)(model, X_fit, y_fit, X_eval)
+                for _, _, model, X_fit, y_fit, X_eval, _ in tasks
+            )
+            logger.info(f"   {len(tasks)} fits finished in {time.perf_counter() - started:.1f}s")
+            
+            fitted = {}
+            cv_scores = {name: [] for name in models}
+            fit_seconds = {name: 0.0 for name in models}
+            for (name, fold, _, _, _, _, y_eval), (model, y_pred, elapsed) in zip(tasks, outcomes):
+                fit_seconds[name] += elapsed
+                if fold is None:
+                    fitted[name] = (model, y_pred, elapsed)
+                else:
+                    cv_scores[name].append(r2_score(y_eval, y_pred))
+            
+            for name in models:
+                model, y_pred, elapsed = fitted[name]
                 
                 # Evaluate
                 mae = mean_absolute_error(y_test, y_pred)
                 mse = mean_squared_error(y_test, y_pred)
                 r2 = r2_score(y_test, y_pred)
-                
-                # Cross-validation
-                cv_scores = cross_val_score(model, X_train, y_train, cv=5, scoring='r2')
+                scores = np.array(cv_scores[name])
                 
                 results[name] = {
                     'mae': mae,
                     'mse': mse,
                     'r2': r2,
-                    'cv_mean': cv_scores.mean(),
-                    'cv_std': cv_scores.std()
+                    'cv_mean': scores.mean(),
+                    'cv_std': scores.std(),
+                    'fit_seconds': round(elapsed, 3),
+                    'total_fit_seconds': round(fit_seconds[name], 3)
                 }
+                if name in search_trials:
+                    results[name]['params'] = search_trials[name]['params']
+                    results[name]['p99_ms'] = search_trials[name]['p99_ms']
                 
-                logger.info(f"   {name.upper():<20} R²: {r2:.3f} | MAE: {mae:.2f} | CV: {cv_scores.mean():.3f} ± {cv_scores.std():.3f}")
+                logger.info(
+                    f"   {name.upper():<20} R²: {r2:.3f} | MAE: {mae:.2f} | CV: {scores.mean():.3f} ± {scores.std():.3f} "
+                    f"| fit: {elapsed:.2f}s (with CV: {fit_seconds[name]:.2f}s)"
+                )
                 
-                # Track best model
-                if r2 > best_score:
+                # Track best model (penalizing searched models that miss the latency budget)
+                objective = searcher.objective(r2, results[name].get('p99_ms')) if searcher else r2
+                if objective > best_objective:
+                    best_objective = objective
                     best_score = r2
                     best_model = model
                     best_model_name = name
             
             # Save the best model
             if best_model:
-                model_path = os.path.join(self.models_dir, 'credit_model.pkl')
-                scaler_path = os.path.join(self.models_dir, 'scaler.pkl')
-                
-                joblib.dump(best_model, model_path)
-                joblib.dump(scaler, scaler_path)
+                # Persist the untouched test split so evaluation reuses exactly these rows
+                holdout = X_test.copy()
+                holdout[self.target] = y_test
+                holdout_name = self.dataset_store.save(
+                    holdout, 'holdout', mark_latest=False,
+                    feature_version=FEATURE_VERSION, source_dataset=df.attrs.get('dataset')
+                )
                 
-                # Save model metadata
+                training_date = datetime.now().isoformat()
                 metadata = {
                     'model_name': best_model_name,
-                    'training_date': datetime.now().isoformat(),
+                    'training_date': training_date,
                     'features': self.features,
                     'performance': results[best_model_name],
                     'dataset_size': len(df),
-                    'use_synthetic': use_synthetic
+                    'dataset': df.attrs.get('dataset'),
+                    'holdout_dataset': holdout_name,
+                    'use_synthetic': use_synthetic,
+                    # Incremental runs only collect rows changed after this point
+                    'training_watermark': df.attrs.get('watermark'),
+                    'last_full_training': training_date,
+                    'incremental_updates': 0
                 }
-                
-                with open(os.path.join(self.models_dir, 'model_metadata.json'), 'w') as f:
-                    json.dump(metadata, f, indent=2)
+                version = self._save_model(best_model, scaler, metadata, promote=promote)
                 
                 logger.info(f"✅ Best model: {best_model_name} (R²: {best_score:.3f})")
-                logger.info(f"💾 Model saved to: {model_path}")
+                logger.info(f"💾 Model saved as version {version}{'' if promote else ' (not promoted)'}")
                 
                 return {
                     'best_model': best_model_name,
                     'best_score': best_score,
                     'results': results,
-                    'model_path': model_path
+                    'version': version,
+                    'promoted': promote,
+                    'model_path': self.registry.version_dir(version)
                 }
             else:
                 logger.error("❌ No model trained successfully")
@@ -308,31 +389,208 @@ class MLModelTrainer:
             logger.error(f"❌ Model training failed: {e}")
             return None
     
-    def evaluate_model(self, model_path=None):
-        """Evaluate the trained model"""
+    def train_incremental(self, full_rebuild_days=None, extra_estimators=None, n_jobs=1, progress=None, promote=True,
+                          min_rows=None):
+        """Update the saved model with rows changed since its training watermark.
+
+        Tree ensembles grow extra_estimators new trees/stages fitted on the
+        changed rows (warm_start); the linear model is continued with
+        SGDRegressor.partial_fit on the same scaler. A full rebuild runs
+        instead when there is no usable watermark or model, or the last
+        full rebuild is older than full_rebuild_days. Fewer than min_rows
+        changed rows leave the model and watermark as they are, so the
+        rows are picked up by a later run.
+        """
         try:
-            if model_path is None:
-                model_path = os.path.join(self.models_dir, 'credit_model.pkl')
+            if full_rebuild_days is None:
+                full_rebuild_days = getattr(settings, 'CREDIT_MODEL_FULL_REBUILD_DAYS', 7)
+            if extra_estimators is None:
+                extra_estimators = getattr(settings, 'CREDIT_MODEL_INCREMENTAL_ESTIMATORS', 10)
+            if min_rows is None:
+                min_rows = getattr(settings, 'CREDIT_MODEL_INCREMENTAL_MIN_ROWS', 20)
+            
+            metadata = self._read_metadata()
+            
+            reason = self._full_rebuild_reason(metadata, full_rebuild_days)
+            model = scaler = None
+            if reason is None:
+                model, scaler = self.load_model()
+                if type(model).__name__ not in self.INCREMENTAL_MODELS:
+                    reason = f"{type(model).__name__} can't be updated incrementally"
+            
+            if reason:
+                logger.info(f"🔁 Full rebuild: {reason}")
+                result = self.train_models(use_synthetic=False, progress=progress, n_jobs=n_jobs, promote=promote)
+                if result:
+                    result['mode'] = 'full'
+                return result
+            
+            since = datetime.fromisoformat(metadata['training_watermark'])
+            df = self.collect_training_data(progress=progress, since=since)
+            if df.empty:
+                logger.info(f"✅ No feature changes since {since.isoformat()}, model left as is")
+                return {'mode': 'incremental', 'rows': 0, 'model_name': metadata['model_name']}
+            if len(df) < max(min_rows, 2):
+                logger.info(f"⏸️ Only {len(df)} changed rows since {since.isoformat()}, model left as is")
+                return {'mode': 'incremental', 'rows': 0, 'pending_rows': len(df), 'model_name': metadata['model_name']}
             
-            if not os.path.exists(model_path):
+            X = df[self.features]
+            y = df[self.target]
+            
+            r2_before = self._score_rows(model, scaler, X, y)
+            model = self._update_model(model, scaler, X, y, extra_estimators)
+            r2_after = self._score_rows(model, scaler, X, y)
+            
+            metadata.update({
+                'parent_version': metadata.get('version'),
+                'model_name': metadata['model_name'] if not isinstance(model, SGDRegressor) else 'sgd_regression',
+                'training_date': datetime.now().isoformat(),
+                'dataset': df.attrs.get('dataset'),
+                'training_watermark': df.attrs['watermark'],
+                'incremental_updates': metadata.get('incremental_updates', 0) + 1,
+                'last_increment': {'rows': len(df), 'r2_before': r2_before, 'r2_after': r2_after}
+            })
+            summary = f"R² on new rows: {self._format_r2(r2_before)} -> {self._format_r2(r2_after)}"
+            
+            # Nothing after this may fail: once promoted, the new version is live
+            version = self._save_model(model, scaler, metadata, promote=promote)
+            
+            logger.info(f"✅ Incremental update on {len(df)} rows ({summary})")
+            return {
+                'mode': 'incremental',
+                'rows': len(df),
+                'model_name': metadata['model_name'],
+                'version': version,
+                'r2_before': r2_before,
+                'r2_after': r2_after
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Incremental training failed: {e}")
+            return None
+    
+    def _read_metadata(self):
+        """Metadata of the live registry version, or of the legacy flat files"""
+        try:
+            if self.registry.current_version() is not None:
+                return self.registry.read_metadata()
+            with open(os.path.join(self.models_dir, 'model_metadata.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def load_model(self, version=None):
+        """Model and scaler of a registry version (the live one by default), or the legacy flat files"""
+        if version or self.registry.current_version() is not None:
+            model, scaler, _, _ = self.registry.load(version, use_mmap=False, use_compiled=False)
+            return model, scaler
+        
+        model_path = os.path.join(self.models_dir, 'credit_model.pkl')
+        if not os.path.exists(model_path):
+            return None, None
+        return joblib.load(model_path), joblib.load(os.path.join(self.models_dir, 'scaler.pkl'))
+    
+    def _full_rebuild_reason(self, metadata, full_rebuild_days):
+        if not metadata:
+            return "no trained model"
+        if not metadata.get('training_watermark'):
+            return "model has no training watermark (not trained on database rows)"
+        
+        last_full = datetime.fromisoformat(metadata.get('last_full_training') or metadata['training_date'])
+        if datetime.now() - last_full >= timedelta(days=full_rebuild_days):
+            return f"last full rebuild on {last_full.date()} is over {full_rebuild_days} days old"
+        return None
+    
+    def _update_model(self, model, scaler, X, y, extra_estimators):
+        if isinstance(model, (RandomForestRegressor, GradientBoostingRegressor)):
+            # warm_start keeps the fitted trees/stages and fits only the new ones
+            model.set_params(warm_start=True, n_estimators=model.n_estimators + extra_estimators)
+            model.fit(X, y)
+            return model
+        
+        if isinstance(model, LinearRegression):
+            # Continue from the closed-form solution with an online regressor
+            sgd = SGDRegressor(random_state=42)
+            sgd.coef_ = model.coef_.astype(float)
+            sgd.intercept_ = np.atleast_1d(model.intercept_).astype(float)
+            model = sgd
+        
+        model.partial_fit(scaler.transform(X), y)
+        return model
+    
+    def _score_rows(self, model, scaler, X, y):
+        if len(y) < 2:
+            return None
+        if hasattr(model, 'coef_'):
+            return r2_score(y, model.predict(scaler.transform(X)))
+        return r2_score(y, model.predict(X))
+    
+    def _format_r2(self, r2):
+        return 'n/a' if r2 is None else f"{r2:.3f}"
+    
+    def _save_model(self, model, scaler, metadata, promote=True):
+        """Register the model as a new version and, unless told otherwise, make it live"""
+        version = self.registry.create_version(model, scaler, metadata)
+        if promote:
+            self.registry.promote(version)
+            self.registry.prune(keep=getattr(settings, 'CREDIT_MODEL_KEEP_VERSIONS', 10))
+        return version
+    
+    def _search_hyperparameters(self, X_train, y_train, strategy, n_trials, n_jobs, latency_budget_ms, seed):
+        """Run a hyperparameter search on the training split and record every trial"""
+        from apps.ubuntucap.ml_engine.training.search import HyperparameterSearch
+        
+        logger.info(f"🔎 Running {strategy} hyperparameter search ({n_trials} trials)...")
+        searcher = HyperparameterSearch(
+            X_train, y_train, n_jobs=n_jobs, latency_budget_ms=latency_budget_ms, random_state=seed
+        )
+        if strategy == 'halving':
+            searcher.successive_halving(n_candidates=n_trials)
+        else:
+            searcher.random_search(n_trials=n_trials)
+        
+        searcher.save_results(os.path.join(self.models_dir, 'search_results.csv'))
+        return searcher
+    
+    def evaluate_model(self, version=None):
+        """Evaluate a model (the live version by default) on the hold-out set saved when it was trained.
+
+        The hold-out rows are scored in one pass by the candidate itself
+        (its compiled ensemble when it has one), clipped to 0-100 as in
+        serving. Scoring errors fail the evaluation rather than falling
+        back to rule-based scores.
+        """
+        try:
+            # Load model, scaler and metadata
+            if version or self.registry.current_version() is not None:
+                model, scaler, compiled, version = self.registry.load(version, use_mmap=False)
+                metadata = self.registry.read_metadata(version)
+            else:
+                model, scaler = self.load_model()
+                compiled, metadata = None, self._read_metadata() or {}
+            if model is None:
                 logger.error("❌ Model file not found")
                 return None
             
-            # Load model and metadata
-            model = joblib.load(model_path)
-            scaler = joblib.load(os.path.join(self.models_dir, 'scaler.pkl'))
-            
-            # Generate test data
-            test_df = self.generate_synthetic_data(200)
-            X_test = test_df[self.features]
-            y_test = test_df[self.target]
+            holdout_name = metadata.get('holdout_dataset')
+            if holdout_name:
+                test_df = self.dataset_store.load(holdout_name)
+            else:
+                logger.warning("⚠️ Model has no saved hold-out set, evaluating on synthetic data")
+                test_df = self.generate_synthetic_data(200, save=False)
+            X_test = test_df[self.features].to_numpy(dtype=float)
+            y_test = test_df[self.target].to_numpy(dtype=float)
             
             # Predict
-            if hasattr(model, 'feature_importances_'):
-                y_pred = model.predict(X_test)
+            started = time.perf_counter()
+            if compiled is not None:
+                y_pred = compiled.predict(X_test)
+            elif hasattr(model, 'coef_'):
+                y_pred = model.predict(scaler.transform(X_test))
             else:
-                X_test_scaled = scaler.transform(X_test)
-                y_pred = model.predict(X_test_scaled)
+                y_pred = model.predict(X_test)
+            y_pred = np.clip(y_pred, 0, 100)
+            elapsed = time.perf_counter() - started
             
             # Calculate metrics
             mae = mean_absolute_error(y_test, y_pred)
@@ -350,14 +608,25 @@ class MLModelTrainer:
                 'mae': mae,
                 'mse': mse,
                 'r2': r2,
+                'per_row_ms': elapsed * 1000 / max(len(y_test), 1),
+                'calibration': self._calibration_by_band(y_test, y_pred),
                 'feature_importance': feature_importance,
+                'holdout_dataset': holdout_name,
                 'test_samples': len(test_df)
             }
             
-            logger.info(f"�� Model Evaluation:")
+            logger.info(f"📊 Model Evaluation ({len(test_df)} hold-out rows):")
             logger.info(f"   R² Score: {r2:.3f}")
             logger.info(f"   MAE: {mae:.2f}")
             logger.info(f"   MSE: {mse:.2f}")
+            logger.info(f"   Inference: {evaluation['per_row_ms']:.4f} ms/row")
+            
+            logger.info("   Calibration by score band:")
+            for band in evaluation['calibration']:
+                logger.info(
+                    f"     {band['band']:<8} n={band['count']:<6} predicted: {band['mean_predicted']:6.2f} "
+                    f"| actual: {band['mean_actual']:6.2f} | MAE: {band['mae']:.2f}"
+                )
             
             if feature_importance:
                 logger.info("   Feature Importance:")
@@ -370,29 +639,23 @@ class MLModelTrainer:
             logger.error(f"❌ Model evaluation failed: {e}")
             return None
     
-    def _calculate_actual_performance(self, user):
-        """Calculate actual credit performance"""
-        from apps.ubuntucap.ml_engine.credit_scorer import CreditScoringModel
-        scorer = CreditScoringModel()
-        return scorer.predict_credit_score(user)
-    
-    def _calculate_default_rate(self, user):
-        """Calculate user's actual default rate"""
-        try:
-            total_loans = user.loans.count()
-            if total_loans == 0:
-                return 0.0
-            defaulted_loans = user.loans.filter(status='defaulted').count()
-            return defaulted_loans / total_loans
-        except:
-            return 0.0
-    
-    def _calculate_activity_score(self, profile):
-        """Calculate M-Pesa activity score"""
-        activity_map = {
-            'very_high': 0.9,
-            'high': 0.7,
-            'medium': 0.5,
-            'low': 0.3
-        }
-        return activity_map.get(profile.mpesa_activity_level, 0.5)
+    def _calibration_by_band(self, y_true, y_pred):
+        """Mean predicted vs actual score within each predicted score band"""
+        bands = np.digitize(y_pred, self.CALIBRATION_BANDS[1:-1])
+        counts = np.bincount(bands, minlength=len(self.CALIBRATION_BANDS) - 1)
+        predicted_sum = np.bincount(bands, weights=y_pred, minlength=len(counts))
+        actual_sum = np.bincount(bands, weights=y_true, minlength=len(counts))
+        error_sum = np.bincount(bands, weights=np.abs(y_pred - y_true), minlength=len(counts))
+        
+        calibration = []
+        for i, count in enumerate(counts):
+            if not count:
+                continue
+            calibration.append({
+                'band': f"{self.CALIBRATION_BANDS[i]}-{self.CALIBRATION_BANDS[i + 1]}",
+                'count': int(count),
+                'mean_predicted': float(predicted_sum[i] / count),
+                'mean_actual': float(actual_sum[i] / count),
+                'mae': float(error_sum[i] / count)
+            })
+        return calibration
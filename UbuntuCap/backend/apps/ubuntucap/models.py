@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import models
+from apps.ubuntucap.ml_engine.features import FEATURE_NAMES, FEATURE_VERSION
+
+class CreditFeatureVector(models.Model):
+    """Materialized credit features, one row per user"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='credit_features')
+    
+    avg_monthly_volume = models.FloatField(default=0)
+    transaction_consistency = models.FloatField(default=0)
+    business_age_months = models.IntegerField(default=0)
+    savings_ratio = models.FloatField(default=0)
+    loan_history_count = models.IntegerField(default=0)
+    default_rate = models.FloatField(default=0)
+    mpesa_activity_score = models.FloatField(default=0)
+    customer_rating = models.FloatField(default=3.0)
+    transaction_count_30d = models.IntegerField(default=0)
+    income_consistency_score = models.FloatField(default=0)
+    has_regular_income = models.IntegerField(default=0)
+    negative_balance_days = models.IntegerField(default=0)
+    
+    feature_version = models.IntegerField(default=FEATURE_VERSION)
+    computed_at = models.DateTimeField(auto_now=True, db_index=True)
+    
+    class Meta:
+        db_table = 'credit_feature_vectors'
+    
+    def __str__(self):
+        return f"Features v{self.feature_version} for {self.user_id}"
+    
+    @property
+    def is_current(self):
+        return self.feature_version == FEATURE_VERSION
+    
+    def as_dict(self):
+        return {name: getattr(self, name) for name in FEATURE_NAMES}
@@ -43,13 +43,32 @@ class LiveMpesaService:
             logger.error(f"❌ Error getting access token: {e}")
             return None
     
-    def get_transaction_history(self, user, days=90):
-        """Fetch real transaction history from M-Pesa"""
+    def get_transaction_history(self, user, days=90, full_resync=False):
+        """Sync real transaction history from M-Pesa, only since the last sync unless full_resync"""
+        from apps.ubuntucap.services.mpesa_service import MpesaService
+        mpesa_service = MpesaService()
+        
+        try:
+            since = None if full_resync else mpesa_service.get_sync_watermark(user)
+            transactions = self.fetch_transactions(user, days, since=since)
+            mpesa_service.merge_transactions(user, transactions)
+            return transactions
+            
+        except Exception as e:
+            logger.error(f"❌ M-Pesa sync failed for {user.phone_number}: {e}")
+            return []
+    
+    def fetch_transactions(self, user, days=90, since=None):
+        """Fetch real transactions from the last days (after since, if given) without storing them"""
         try:
             access_token = self.get_access_token()
             if not access_token:
                 logger.warning("⚠️  Could not get access token, using mock data")
-                return self._get_fallback_mock_data(user, days)
+                return self._get_fallback_mock_data(user, days, since)
+            
+            start = timezone.now() - timezone.timedelta(days=days)
+            if since and since > start:
+                start = since
             
             headers = {
                 'Authorization': f'Bearer {access_token}',
@@ -60,7 +79,7 @@ class LiveMpesaService:
             # API requires business-level agreements with Safaricom
             payload = {
                 'phone_number': user.phone_number,
-                'start_date': (timezone.now() - timezone.timedelta(days=days)).strftime('%Y-%m-%d'),
+                'start_date': start.strftime('%Y-%m-%d'),
                 'end_date': timezone.now().strftime('%Y-%m-%d')
             }
             
@@ -74,14 +93,20 @@ class LiveMpesaService:
             
             if response.status_code == 200:
                 logger.info(f"✅ Successfully fetched live M-Pesa data for {user.phone_number}")
-                return self._parse_transaction_data(response.json(), user)
+                transactions = self._parse_transaction_data(response.json(), user)
+                
+                # The API filters by date, so drop rows older than the watermark. Rows at the
+                # watermark itself are kept: ingest skips the ones already stored by transaction_id
+                if since:
+                    transactions = [tx for tx in transactions if tx.transaction_time >= since]
+                return transactions
             else:
                 logger.warning(f"⚠️  Live API failed ({response.status_code}), falling back to mock data")
-                return self._get_fallback_mock_data(user, days)
+                return self._get_fallback_mock_data(user, days, since)
                 
         except Exception as e:
             logger.error(f"❌ Live M-Pesa fetch failed: {e}")
-            return self._get_fallback_mock_data(user, days)
+            return self._get_fallback_mock_data(user, days, since)
     
     def _parse_transaction_data(self, api_response, user):
         """Parse real M-Pesa API response"""
@@ -89,6 +114,11 @@ class LiveMpesaService:
         
         transactions = []
         for tx in api_response.get('transactions', []):
+            # Timestamps without an offset are in the project time zone
+            transaction_time = datetime.fromisoformat(tx.get('timestamp', timezone.now().isoformat()))
+            if timezone.is_naive(transaction_time):
+                transaction_time = timezone.make_aware(transaction_time)
+            
             transaction = MpesaTransaction(
                 user=user,
                 transaction_id=tx.get('transaction_id', f"MPE{tx.get('id', '0000000000')}"),
@@ -98,7 +128,7 @@ class LiveMpesaService:
                 sender=tx.get('sender', ''),
                 receiver=tx.get('receiver', ''),
                 description=tx.get('description', 'M-Pesa Transaction'),
-                transaction_time=datetime.fromisoformat(tx.get('timestamp', timezone.now().isoformat())),
+                transaction_time=transaction_time,
                 is_high_risk=self._assess_risk(tx)
             )
             transactions.append(transaction)
@@ -106,12 +136,12 @@ class LiveMpesaService:
         logger.info(f"✅ Parsed {len(transactions)} transactions from M-Pesa API")
         return transactions
     
-    def _get_fallback_mock_data(self, user, days):
+    def _get_fallback_mock_data(self, user, days, since=None):
         """Fallback to mock data when live API fails"""
         from apps.ubuntucap.services.mpesa_service import MpesaService
         mpesa_service = MpesaService()
         logger.info("🔄 Using mock M-Pesa data as fallback")
-        return mpesa_service.get_transaction_history(user, days)
+        return mpesa_service.fetch_transactions(user, days, since=since)
     
     def _map_transaction_type(self, mpesa_type):
         """Map M-Pesa transaction types to internal types"""
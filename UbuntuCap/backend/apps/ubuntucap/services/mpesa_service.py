@@ -2,6 +2,9 @@ import requests
 import base64
 from datetime import datetime, timedelta
 from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 import logging
 import random
@@ -9,11 +12,162 @@ from decimal import Decimal
 
 logger = logging.getLogger(__name__)
 
+def ingest_transactions(transactions, batch_size=None):
+    """Store unsaved MpesaTransaction objects in bulk, skipping ones already stored.
+
+    Known transaction_ids are looked up once per batch and the rest are
+    inserted with bulk_create; ignore_conflicts covers rows another sync
+    inserted in the meantime. Daily rollups for the new rows' days are
+    rebuilt in the same transaction. Returns inserted and duplicate counts.
+    """
+    from apps.users.models import MpesaTransaction
+    
+    batch_size = batch_size or getattr(settings, 'MPESA_INGEST_BATCH_SIZE', 500)
+    
+    # Repeated ids within one fetch count as duplicates too
+    unique = {}
+    for tx in transactions:
+        unique.setdefault(tx.transaction_id, tx)
+    transaction_ids = list(unique)
+    
+    with db_transaction.atomic():
+        existing = set()
+        for start in range(0, len(transaction_ids), batch_size):
+            existing.update(MpesaTransaction.objects.filter(
+                transaction_id__in=transaction_ids[start:start + batch_size]
+            ).values_list('transaction_id', flat=True))
+        
+        new_transactions = [tx for transaction_id, tx in unique.items() if transaction_id not in existing]
+        MpesaTransaction.objects.bulk_create(new_transactions, batch_size=batch_size, ignore_conflicts=True)
+        rebuild_daily_rollups(new_transactions, batch_size=batch_size)
+    
+    return {
+        'inserted': len(new_transactions),
+        'duplicates': len(transactions) - len(new_transactions)
+    }
+
+# Transaction types counted as inflow in rollups; everything else is outflow
+INFLOW_TYPES = ['receive_money']
+
+def rebuild_daily_rollups(transactions=None, batch_size=None):
+    """Recompute MpesaDailyRollup rows for the days the given transactions fall on.
+
+    Each touched (user, day) is rebuilt from all of that day's stored
+    transactions in one grouped query and upserted, so repeated or
+    overlapping syncs can't double count. Without transactions, every
+    stored day is rebuilt. Returns the number of rollups written.
+    """
+    from apps.users.models import MpesaTransaction, MpesaDailyRollup
+    
+    batch_size = batch_size or getattr(settings, 'MPESA_INGEST_BATCH_SIZE', 500)
+    
+    touched = Q()
+    if transactions is not None:
+        if not transactions:
+            return 0
+        
+        # Time range per user, widened to whole local days
+        ranges = {}
+        for tx in transactions:
+            tx_time = tx.transaction_time
+            if timezone.is_naive(tx_time):
+                tx_time = timezone.make_aware(tx_time)
+            tx_time = timezone.localtime(tx_time)
+            first, last = ranges.get(tx.user_id, (tx_time, tx_time))
+            ranges[tx.user_id] = (min(first, tx_time), max(last, tx_time))
+        
+        for user_id, (first, last) in ranges.items():
+            touched |= Q(
+                user_id=user_id,
+                transaction_time__gte=first.replace(hour=0, minute=0, second=0, microsecond=0),
+                transaction_time__lt=last.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            )
+    
+    inflow = Q(transaction_type__in=INFLOW_TYPES)
+    rows = MpesaTransaction.objects.filter(touched).annotate(
+        day=TruncDate('transaction_time')
+    ).values('user_id', 'day').annotate(
+        inflow_count=Count('id', filter=inflow),
+        inflow_total=Sum('amount', filter=inflow),
+        outflow_count=Count('id', filter=~inflow),
+        outflow_total=Sum('amount', filter=~inflow),
+        min_amount=Min('amount'),
+        max_amount=Max('amount'),
+        min_balance=Min('balance_after'),
+        max_balance=Max('balance_after'),
+        high_risk_count=Count('id', filter=Q(is_high_risk=True))
+    ).order_by()
+    
+    rollups = []
+    for row in rows:
+        row['inflow_total'] = row['inflow_total'] or 0
+        row['outflow_total'] = row['outflow_total'] or 0
+        rollups.append(MpesaDailyRollup(**row))
+    
+    MpesaDailyRollup.objects.bulk_create(
+        rollups,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['user', 'day'],
+        update_fields=[
+            'inflow_count', 'inflow_total', 'outflow_count', 'outflow_total', 'min_amount',
+            'max_amount', 'min_balance', 'max_balance', 'high_risk_count', 'updated_at'
+        ]
+    )
+    return len(rollups)
+
+def aggregate_transaction_metrics(user_ids, today=None):
+    """30- and 90-day transaction metrics per user, in one grouped query.
+
+    Reads MpesaDailyRollup rather than raw transactions, so each window is
+    a sum over at most one row per day. Returns {user_id: metrics}; users
+    without transactions in the last 90 days are missing.
+    """
+    from apps.users.models import MpesaDailyRollup
+    
+    today = today or timezone.localdate()
+    last_30d = Q(day__gt=today - timedelta(days=30))
+    count = F('inflow_count') + F('outflow_count')
+    
+    rows = MpesaDailyRollup.objects.filter(
+        user_id__in=user_ids,
+        day__gt=today - timedelta(days=90)
+    ).values('user_id').annotate(
+        count_30d=Sum(count, filter=last_30d),
+        count_90d=Sum(count),
+        total_90d=Sum(F('inflow_total') + F('outflow_total')),
+        min_amount=Min('min_amount'),
+        max_amount=Max('max_amount'),
+        income_count=Sum('inflow_count'),
+        income_total=Sum('inflow_total'),
+        expense_total=Sum('outflow_total'),
+        high_risk_count=Sum('high_risk_count')
+    ).order_by()
+    
+    metrics = {}
+    for row in rows:
+        user_id = row.pop('user_id')
+        
+        # The 30-day window sums to NULL when it has no activity
+        row['count_30d'] = row['count_30d'] or 0
+        row['avg_amount'] = row['total_90d'] / row['count_90d'] if row['count_90d'] else 0
+        metrics[user_id] = row
+    return metrics
+
 class MpesaService:
+    # Profile fields written by _apply_metrics
+    PROFILE_METRIC_FIELDS = [
+        'avg_monthly_volume', 'avg_transaction_amount', 'max_transaction_amount', 'min_transaction_amount',
+        'transaction_count_30d', 'transaction_count_90d', 'high_risk_transactions', 'savings_ratio',
+        'transaction_consistency', 'income_consistency_score', 'has_regular_income',
+        'mpesa_activity_level', 'mpesa_last_sync'
+    ]
+    
     def __init__(self):
         self.consumer_key = getattr(settings, 'MPESA_CONSUMER_KEY', 'test_key')
         self.consumer_secret = getattr(settings, 'MPESA_CONSUMER_SECRET', 'test_secret')
         self.base_url = getattr(settings, 'MPESA_BASE_URL', 'https://sandbox.safaricom.co.ke')
+        self.last_ingest = {'inserted': 0, 'duplicates': 0}
     
     def get_access_token(self):
         """Get OAuth token from M-Pesa"""
@@ -24,19 +178,27 @@ class MpesaService:
             logger.error(f"Error getting access token: {e}")
             return None
     
-    def get_transaction_history(self, user, days=90):
+    def get_sync_watermark(self, user):
+        """transaction_time of the newest stored transaction, or None before the first sync"""
+        from apps.users.models import MpesaTransaction
+        
+        return MpesaTransaction.objects.filter(user=user).aggregate(
+            latest=Max('transaction_time')
+        )['latest']
+    
+    def get_transaction_history(self, user, days=90, full_resync=False):
         """
-        Get user's M-Pesa transaction history
-        Note: This uses a mock implementation for development
+        Sync user's M-Pesa transactions and return the newly fetched ones
+        
+        Only transactions after the newest stored one are fetched unless
+        full_resync is set. Note: This uses a mock implementation for development
         """
         try:
-            from apps.users.models import MpesaTransaction
+            since = None if full_resync else self.get_sync_watermark(user)
+            transactions = self.fetch_transactions(user, days, since=since)
             
-            # Generate realistic mock transactions
-            transactions = self._generate_mock_transactions(user, days)
-            
-            # Update user profile with analyzed data
-            self._update_user_profile_from_transactions(user, transactions)
+            # Merge into stored history and update user profile with analyzed data
+            self.merge_transactions(user, transactions)
             
             return transactions
             
@@ -44,18 +206,40 @@ class MpesaService:
             logger.error(f"Error getting transaction history: {e}")
             return []
     
-    def _generate_mock_transactions(self, user, days):
+    def fetch_transactions(self, user, days=90, since=None):
+        """Fetch transactions from the last days (after since, if given) without storing them"""
+        # Generate realistic mock transactions
+        return self._generate_mock_transactions(user, days, since=since)
+    
+    def merge_transactions(self, user, transactions):
+        """Store newly fetched transactions and refresh the profile from stored history"""
+        # Store new transactions and update the profile in one database transaction
+        with db_transaction.atomic():
+            self.last_ingest = ingest_transactions(transactions)
+            self.refresh_profile_metrics(user)
+        
+        logger.info(
+            f"Stored {self.last_ingest['inserted']} new M-Pesa transactions for {user.phone_number} "
+            f"({self.last_ingest['duplicates']} already stored)"
+        )
+        return self.last_ingest
+    
+    def _generate_mock_transactions(self, user, days, since=None):
         """Generate realistic mock transactions for development"""
         from apps.users.models import MpesaTransaction
         
         transactions = []
         now = timezone.now()
+        start = now - timedelta(days=days)
+        if since and since > start:
+            start = since
+        window_seconds = (now - start).total_seconds()
         
-        # Generate 30-60 transactions for a 90-day period
-        transaction_count = random.randint(30, 60)
+        # Generate 30-60 transactions for the full period, fewer for an incremental window
+        transaction_count = int(random.randint(30, 60) * window_seconds / (days * 86400))
         
         for i in range(transaction_count):
-            transaction_date = now - timedelta(days=random.randint(0, days))
+            transaction_date = start + timedelta(seconds=random.uniform(0, window_seconds))
             
             # Vary amount based on user's business type
             if user.business_type == 'Retail':
@@ -89,61 +273,68 @@ class MpesaService:
         
         return transactions
     
-    def _update_user_profile_from_transactions(self, user, transactions):
-        """Analyze transactions and update user profile"""
-        try:
-            from apps.users.models import UserProfile
-            
-            profile, created = UserProfile.objects.get_or_create(user=user)
-            
-            if not transactions:
-                return
-            
-            # Calculate key metrics
-            total_amount = sum(t.amount for t in transactions)
-            transaction_count = len(transactions)
-            avg_amount = total_amount / transaction_count if transaction_count > 0 else 0
-            
-            # Count transactions by type
-            receive_count = len([t for t in transactions if t.transaction_type == 'receive_money'])
-            send_count = len([t for t in transactions if t.transaction_type in ['send_money', 'pay_bill', 'buy_goods']])
-            
+    def refresh_profile_metrics(self, user):
+        """Recompute the user's profile metrics from stored transactions.
+
+        Errors propagate so a surrounding atomic block rolls back.
+        """
+        from apps.users.models import UserProfile
+        
+        profile, created = UserProfile.objects.get_or_create(user=user)
+        metrics = aggregate_transaction_metrics([user.pk]).get(user.pk)
+        
+        self._apply_metrics(profile, metrics)
+        profile.save()
+        
+        logger.info(f"Updated profile for {user.phone_number} with {profile.transaction_count_90d} transactions")
+        return profile
+    
+    def _apply_metrics(self, profile, metrics):
+        """Set the profile's window metrics; no activity in the last 90 days resets them to zero"""
+        transaction_count = metrics['count_90d'] if metrics else 0
+        
+        if transaction_count:
             # Calculate consistency (ratio of receive transactions)
-            income_consistency = receive_count / transaction_count if transaction_count > 0 else 0
+            income_consistency = metrics['income_count'] / transaction_count
             
-            # Update profile
-            profile.avg_monthly_volume = float(total_amount) * (30/90)  # Extrapolate to monthly
-            profile.avg_transaction_amount = avg_amount
-            profile.transaction_count_90d = transaction_count
-            profile.transaction_count_30d = int(transaction_count / 3)
-            profile.transaction_consistency = income_consistency
-            profile.income_consistency_score = income_consistency
-            profile.has_regular_income = income_consistency > 0.5  # Regular if >50% are incoming
+            profile.avg_monthly_volume = metrics['total_90d'] * Decimal(30) / Decimal(90)  # Monthly average over 90 days
+            profile.avg_transaction_amount = metrics['avg_amount']
+            profile.max_transaction_amount = metrics['max_amount']
+            profile.min_transaction_amount = metrics['min_amount']
+            profile.transaction_count_30d = metrics['count_30d']
+            profile.high_risk_transactions = metrics['high_risk_count']
             
             # Calculate savings ratio (simplified - income vs expenses)
-            if receive_count > 0:
-                total_income = sum(t.amount for t in transactions if t.transaction_type == 'receive_money')
-                total_expenses = sum(t.amount for t in transactions if t.transaction_type != 'receive_money')
-                if total_income > 0:
-                    profile.savings_ratio = max(0, (total_income - total_expenses) / total_income)
-            
-            # Set activity level
-            if profile.transaction_count_30d >= 40:
-                profile.mpesa_activity_level = 'very_high'
-            elif profile.transaction_count_30d >= 25:
-                profile.mpesa_activity_level = 'high'
-            elif profile.transaction_count_30d >= 15:
-                profile.mpesa_activity_level = 'medium'
-            else:
-                profile.mpesa_activity_level = 'low'
-            
-            profile.mpesa_last_sync = timezone.now()
-            profile.save()
-            
-            logger.info(f"Updated profile for {user.phone_number} with {transaction_count} transactions")
-            
-        except Exception as e:
-            logger.error(f"Error updating profile from transactions: {e}")
+            total_income = metrics['income_total'] or 0
+            total_expenses = metrics['expense_total'] or 0
+            profile.savings_ratio = max(0, float((total_income - total_expenses) / total_income)) if total_income > 0 else 0
+        else:
+            income_consistency = 0
+            profile.avg_monthly_volume = 0
+            profile.avg_transaction_amount = 0
+            profile.max_transaction_amount = 0
+            profile.min_transaction_amount = 0
+            profile.transaction_count_30d = 0
+            profile.high_risk_transactions = 0
+            profile.savings_ratio = 0
+        
+        profile.transaction_count_90d = transaction_count
+        profile.transaction_consistency = income_consistency
+        profile.income_consistency_score = income_consistency
+        profile.has_regular_income = income_consistency > 0.5  # Regular if >50% are incoming
+        
+        # Set activity level
+        if profile.transaction_count_30d >= 40:
+            profile.mpesa_activity_level = 'very_high'
+        elif profile.transaction_count_30d >= 25:
+            profile.mpesa_activity_level = 'high'
+        elif profile.transaction_count_30d >= 15:
+            profile.mpesa_activity_level = 'medium'
+        else:
+            profile.mpesa_activity_level = 'low'
+        
+        profile.mpesa_last_sync = timezone.now()
+        return profile
     
     def analyze_credit_worthiness(self, user):
         """Analyze user's M-Pesa history for loan qualification"""
@@ -1,259 +1,177 @@
-import requests
-import base64
-from datetime import datetime, timedelta
-from django.conf import settings
-from django.utils import timezone
 import logging
-import json
-import random
-from decimal import Decimal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Max
+from apps.ubuntucap.services.mpesa_service import MpesaService, ingest_transactions, aggregate_transaction_metrics
 
 logger = logging.getLogger(__name__)
 
-class MpesaService:
-    def __init__(self):
-        self.consumer_key = getattr(settings, 'MPESA_CONSUMER_KEY', 'test_consumer_key')
-        self.consumer_secret = getattr(settings, 'MPESA_CONSUMER_SECRET', 'test_secret')
-        self.base_url = getattr(settings, 'MPESA_BASE_URL', 'https://sandbox.safaricom.co.ke')
-    
-    def get_access_token(self):
-        """Get OAuth token from M-Pesa"""
-        try:
-            # For development, return a mock token
-            # In production, implement actual M-Pesa OAuth
-            return "mock_access_token_12345"
-                
-        except Exception as e:
-            logger.error(f"Error getting access token: {e}")
-            return None
-    
-    def get_transaction_history(self, user, days=90):
-        """
-        Get user's M-Pesa transaction history
-        Note: This uses a mock implementation for development
-        """
-        try:
-            from apps.users.models import MpesaTransaction
-            
-            # Generate realistic mock transactions
-            transactions = self._generate_mock_transactions(user, days)
-            
-            # Update user profile with analyzed data
-            self._update_user_profile_from_transactions(user, transactions)
-            
-            return transactions
-            
-        except Exception as e:
-            logger.error(f"Error getting transaction history: {e}")
-            return []
-    
-    def _generate_mock_transactions(self, user, days):
-        """Generate realistic mock transactions for development"""
+class MpesaDataSync:
+    """Bulk M-Pesa sync for every user who has granted consent.
+
+    Users are read in primary-key chunks. Each chunk's fetches run on a
+    bounded thread pool, starting from the user's stored watermark, while
+    the previous chunk is ingested on the main thread: one bulk insert,
+    one rollup upsert, one metrics query, a bulk profile update and one
+    feature vector upsert, so the statement count grows with chunks, not
+    users. Fetches never touch the database, so all writes stay on the
+    main thread's connection.
+    """
+
+    def __init__(self, service=None, workers=None, chunk_size=None, days=90):
+        self.service = service or MpesaService()
+        self.workers = workers or getattr(settings, 'MPESA_SYNC_WORKERS', 8)
+        self.chunk_size = chunk_size or getattr(settings, 'MPESA_SYNC_CHUNK_SIZE', 200)
+        self.days = days
+        self.results = []
+        self.stats = {}
+
+    def _user_chunks(self, limit=None):
+        from apps.users.models import User
+
+        users = User.objects.filter(mpesa_consent_granted=True, is_active=True).order_by('pk')
+        last_pk = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+            page = users if last_pk is None else users.filter(pk__gt=last_pk)
+            chunk = list(page[:size])
+            if not chunk:
+                return
+            yield chunk
+            last_pk = chunk[-1].pk
+            if remaining is not None:
+                remaining -= len(chunk)
+
+    def _watermarks(self, chunk):
         from apps.users.models import MpesaTransaction
-        
-        transactions = []
-        now = timezone.now()
-        
-        # Base transaction count based on user's business profile
-        base_transactions = 45  # Average of 15 transactions per month
-        
-        for i in range(base_transactions):
-            transaction_date = now - timedelta(days=random.randint(0, days))
-            
-            # Vary amount based on user's business type
-            if user.business_type == 'Retail':
-                base_amount = 2500
-            elif user.business_type == 'Wholesale':
-                base_amount = 8000
-            else:
-                base_amount = 1500
-                
-            amount = Decimal(random.uniform(base_amount * 0.3, base_amount * 2.5))
-            
-            # More realistic transaction types based on business
-            if random.random() < 0.6:  # 60% receive money (income)
-                transaction_type = 'receive_money'
-            else:
-                transaction_type = random.choice(['send_money', 'pay_bill', 'buy_goods'])
-            
-            transaction = MpesaTransaction(
-                user=user,
-                transaction_id=f"MPE{random.randint(1000000000, 9999999999)}",
-                transaction_type=transaction_type,
-                amount=amount,
-                balance_after=Decimal(random.uniform(5000, 50000)),
-                sender="254700000000" if transaction_type == 'receive_money' else user.phone_number,
-                receiver=user.phone_number if transaction_type == 'receive_money' else "254711000000",
-                description=f"Payment for {user.business_type} business" if transaction_type == 'receive_money' else f"Business expense: {transaction_type.replace('_', ' ')}",
-                transaction_time=transaction_date,
-                is_high_risk=random.random() < 0.03  # 3% chance of high risk
-            )
-            transactions.append(transaction)
-        
-        return transactions
-    
-    def _update_user_profile_from_transactions(self, user, transactions):
-        """Analyze transactions and update user profile"""
+
+        rows = MpesaTransaction.objects.filter(user_id__in=[user.pk for user in chunk]).values('user_id').annotate(
+            latest=Max('transaction_time')
+        ).order_by()
+        return {row['user_id']: row['latest'] for row in rows}
+
+    def _fetch(self, user, since):
+        """Fetch one user's transactions (runs on a worker thread)"""
+        started = time.perf_counter()
         try:
-            from apps.users.models import UserProfile
-            
-            profile, created = UserProfile.objects.get_or_create(user=user)
-            
-            if not transactions:
-                return
-            
-            # Calculate key metrics
-            total_amount = sum(t.amount for t in transactions)
-            transaction_count = len(transactions)
-            avg_amount = total_amount / transaction_count if transaction_count > 0 else 0
-            
-            # Count transactions by type
-            receive_count = len([t for t in transactions if t.transaction_type == 'receive_money'])
-            send_count = len([t for t in transactions if t.transaction_type in ['send_money', 'pay_bill', 'buy_goods']])
-            
-            # Calculate consistency (ratio of receive transactions)
-            income_consistency = receive_count / transaction_count if transaction_count > 0 else 0
-            
-            # Update profile
-            profile.avg_monthly_volume = total_amount * (30/90)  # Extrapolate to monthly
-            profile.avg_transaction_amount = avg_amount
-            profile.transaction_count_90d = transaction_count
-            profile.transaction_count_30d = int(transaction_count / 3)
-            profile.transaction_consistency = income_consistency
-            profile.income_consistency_score = income_consistency
-            profile.has_regular_income = income_consistency > 0.5  # Regular if >50% are incoming
-            
-            # Calculate savings ratio (simplified - income vs expenses)
-            if receive_count > 0:
-                total_income = sum(t.amount for t in transactions if t.transaction_type == 'receive_money')
-                total_expenses = sum(t.amount for t in transactions if t.transaction_type != 'receive_money')
-                if total_income > 0:
-                    profile.savings_ratio = max(0, (total_income - total_expenses) / total_income)
-            
-            # Set activity level
-            if profile.transaction_count_30d >= 40:
-                profile.mpesa_activity_level = 'very_high'
-            elif profile.transaction_count_30d >= 25:
-                profile.mpesa_activity_level = 'high'
-            elif profile.transaction_count_30d >= 15:
-                profile.mpesa_activity_level = 'medium'
-            else:
-                profile.mpesa_activity_level = 'low'
-            
-            profile.mpesa_last_sync = timezone.now()
-            profile.save()
-            
-            # Save transactions to database
-            for transaction in transactions:
-                try:
-                    transaction.save()
-                except:
-                    pass  # Skip if transaction already exists
-            
-            logger.info(f"Updated profile for {user.phone_number} with {transaction_count} transactions")
-            
+            transactions = self.service.fetch_transactions(user, self.days, since=since)
+            return transactions, time.perf_counter() - started, None
         except Exception as e:
-            logger.error(f"Error updating profile from transactions: {e}")
-    
-    def analyze_credit_worthiness(self, user):
-        """Analyze user's M-Pesa history for loan qualification"""
-        try:
-            profile = user.profile
-            
-            analysis = {
-                'transaction_volume_score': self._calculate_volume_score(float(profile.avg_monthly_volume)),
-                'transaction_frequency_score': self._calculate_frequency_score(profile.transaction_count_30d),
-                'consistency_score': profile.income_consistency_score,
-                'balance_stability_score': self._calculate_stability_score(user),
-                'savings_capacity_score': min(1.0, profile.savings_ratio),
-                'risk_indicators': self._identify_risk_indicators(user),
-                'recommended_loan_limit': self._calculate_loan_limit(user),
-                'qualification_status': self._check_qualification(user)
+            return [], time.perf_counter() - started, str(e)
+
+    def _ingest_chunk(self, chunk, futures):
+        fetched = {}
+        for user, future in zip(chunk, futures):
+            transactions, fetch_seconds, error = future.result()
+            result = {
+                'user_id': str(user.pk),
+                'phone_number': user.phone_number,
+                'fetched': len(transactions),
+                'fetch_seconds': round(fetch_seconds, 4),
+                'error': error
             }
-            
-            return analysis
-            
+            self.results.append(result)
+            if error:
+                logger.error(f"❌ M-Pesa fetch failed for {user.phone_number}: {error}")
+            else:
+                fetched[user.pk] = (user, transactions, result)
+
+        if not fetched:
+            return
+
+        started = time.perf_counter()
+        try:
+            with db_transaction.atomic():
+                counts = ingest_transactions([tx for _, transactions, _ in fetched.values() for tx in transactions])
+                self._refresh_profiles([user for user, _, _ in fetched.values()])
         except Exception as e:
-            logger.error(f"Error analyzing credit worthiness: {e}")
-            return None
-    
-    def _calculate_volume_score(self, monthly_volume):
-        """Score based on transaction volume"""
-        if monthly_volume > 100000: return 1.0
-        elif monthly_volume > 50000: return 0.8
-        elif monthly_volume > 25000: return 0.6
-        elif monthly_volume > 10000: return 0.4
-        else: return 0.2
-    
-    def _calculate_frequency_score(self, monthly_transactions):
-        """Score based on transaction frequency"""
-        if monthly_transactions >= 40: return 1.0
-        elif monthly_transactions >= 25: return 0.8
-        elif monthly_transactions >= 15: return 0.6
-        elif monthly_transactions >= 8: return 0.4
-        else: return 0.2
-    
-    def _calculate_stability_score(self, user):
-        """Score based on transaction pattern stability"""
-        profile = user.profile
-        score = 0.5  # Base score
-        
-        # Add points for regular income
-        if profile.has_regular_income:
-            score += 0.3
-        
-        # Add points for good consistency
-        if profile.income_consistency_score > 0.7:
-            score += 0.2
-        
-        return min(1.0, score)
-    
-    def _identify_risk_indicators(self, user):
-        """Identify potential risk factors from M-Pesa data"""
-        profile = user.profile
-        risks = []
-        
-        if profile.avg_monthly_volume < 5000:
-            risks.append('low_transaction_volume')
-        
-        if profile.transaction_count_30d < 5:
-            risks.append('low_transaction_frequency')
-        
-        if profile.income_consistency_score < 0.3:
-            risks.append('irregular_income_pattern')
-        
-        if profile.savings_ratio < 0:
-            risks.append('negative_savings_trend')
-        
-        return risks
-    
-    def _calculate_loan_limit(self, user):
-        """Calculate recommended loan limit based on M-Pesa activity"""
-        profile = user.profile
-        base_limit = float(profile.avg_monthly_volume) * 0.3  # 30% of monthly volume
-        
-        # Adjust based on transaction frequency
-        frequency_multiplier = min(2.0, profile.transaction_count_30d / 20)
-        
-        # Adjust based on consistency
-        consistency_multiplier = profile.income_consistency_score * 1.5
-        
-        final_limit = base_limit * frequency_multiplier * consistency_multiplier
-        
-        return min(100000, max(1000, final_limit))  # Cap between 1,000 and 100,000
-    
-    def _check_qualification(self, user):
-        """Check if user qualifies for loans based on M-Pesa history"""
-        profile = user.profile
-        risks = self._identify_risk_indicators(user)
-        
-        # Basic qualification criteria
-        if (profile.avg_monthly_volume >= 10000 and 
-            profile.transaction_count_30d >= 8 and 
-            profile.income_consistency_score >= 0.4 and
-            len(risks) <= 2):
-            return 'qualified'
-        elif len(risks) >= 4:
-            return 'not_qualified'
-        else:
-            return 'limited_qualification'
\ No newline at end of file
+            logger.error(f"❌ M-Pesa ingest failed for a chunk of {len(fetched)} users: {e}")
+            for _, _, result in fetched.values():
+                result['error'] = f"Ingest failed: {e}"
+            return
+
+        self.stats['inserted'] += counts['inserted']
+        self.stats['duplicates'] += counts['duplicates']
+        self.stats['ingest_seconds'] += time.perf_counter() - started
+
+    def _refresh_profiles(self, users):
+        """Update a chunk's profiles, feature vectors and cached scores in bulk.
+
+        Replaces a per-user profile.save(), whose post_save feature refresh
+        would cost several statements per user.
+        """
+        from apps.users.models import UserProfile
+        from apps.ubuntucap.ml_engine.feature_store import refresh_features_many
+        from apps.ubuntucap.ml_engine.score_cache import score_cache
+
+        user_ids = [user.pk for user in users]
+        profiles = {profile.user_id: profile for profile in UserProfile.objects.filter(user_id__in=user_ids)}
+        missing = [UserProfile(user=user) for user in users if user.pk not in profiles]
+        if missing:
+            UserProfile.objects.bulk_create(missing, ignore_conflicts=True)
+            profiles = {profile.user_id: profile for profile in UserProfile.objects.filter(user_id__in=user_ids)}
+
+        metrics = aggregate_transaction_metrics(user_ids)
+        for user_id, profile in profiles.items():
+            self.service._apply_metrics(profile, metrics.get(user_id))
+        UserProfile.objects.bulk_update(
+            list(profiles.values()),
+            MpesaService.PROFILE_METRIC_FIELDS,
+            batch_size=getattr(settings, 'MPESA_INGEST_BATCH_SIZE', 500)
+        )
+
+        # Reload so features see the stored (rounded) decimals
+        profiles = {profile.user_id: profile for profile in UserProfile.objects.filter(user_id__in=user_ids)}
+        for user in users:
+            user.profile = profiles[user.pk]
+        refresh_features_many(users)
+        db_transaction.on_commit(lambda: score_cache.invalidate_many(user_ids))
+
+    def sync_all_active_users(self, since=None, limit=None):
+        """Sync every consenting user and return how many synced without errors.
+
+        since overrides each user's watermark (transactions after it are
+        fetched); limit caps the number of users.
+        """
+        started = time.perf_counter()
+        self.results = []
+        self.stats = {'inserted': 0, 'duplicates': 0, 'ingest_seconds': 0.0}
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='mpesa-sync') as executor:
+            # Fetch the next chunk while the previous one is being ingested
+            pending = None
+            for chunk in self._user_chunks(limit):
+                watermarks = {} if since else self._watermarks(chunk)
+                futures = [executor.submit(self._fetch, user, since or watermarks.get(user.pk)) for user in chunk]
+                if pending:
+                    self._ingest_chunk(*pending)
+                pending = (chunk, futures)
+            if pending:
+                self._ingest_chunk(*pending)
+
+        fetch_times = sorted(result['fetch_seconds'] for result in self.results)
+        failures = self.failures()
+        self.stats.update({
+            'users': len(self.results),
+            'synced': len(self.results) - len(failures),
+            'failed': len(failures),
+            'fetched': sum(result['fetched'] for result in self.results),
+            'fetch_p50_seconds': fetch_times[len(fetch_times) // 2] if fetch_times else None,
+            'fetch_p95_seconds': fetch_times[int(len(fetch_times) * 0.95)] if fetch_times else None,
+            'fetch_max_seconds': fetch_times[-1] if fetch_times else None,
+            'ingest_seconds': round(self.stats['ingest_seconds'], 3),
+            'total_seconds': round(time.perf_counter() - started, 3),
+            'workers': self.workers
+        })
+
+        logger.info(
+            f"🔄 M-Pesa sync: {self.stats['synced']}/{self.stats['users']} users, "
+            f"{self.stats['inserted']} new transactions in {self.stats['total_seconds']}s"
+        )
+        return self.stats['synced']
+
+    def failures(self):
+        return [result for result in self.results if result['error']]
@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _refresh_user_features(user_id):
+    from apps.users.models import User
+    from apps.ubuntucap.ml_engine.feature_store import refresh_features
+    from apps.ubuntucap.ml_engine.score_cache import score_cache
+
+    score_cache.invalidate(user_id)
+    try:
+        user = User.objects.select_related('profile').filter(pk=user_id).first()
+        if user is None or not hasattr(user, 'profile'):
+            return
+        refresh_features(user)
+    except Exception as e:
+        logger.warning(f"Could not refresh feature vector for user {user_id}: {e}")
+
+def _schedule_refresh(user_id):
+    # Run after commit so cascaded deletes and rolled-back writes are skipped
+    transaction.on_commit(lambda: _refresh_user_features(user_id))
+
+def _invalidate_score(user_id):
+    from apps.ubuntucap.ml_engine.score_cache import score_cache
+    transaction.on_commit(lambda: score_cache.invalidate(user_id))
+
+def profile_saved(sender, instance, **kwargs):
+    """M-Pesa syncs and ML updates land on the profile, so this covers both"""
+    _schedule_refresh(instance.user_id)
+
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is not None and 'business_age_months' not in update_fields:
+        return
+    _schedule_refresh(instance.pk)
+
+def loan_changed(sender, instance, **kwargs):
+    _schedule_refresh(instance.user_id)
+
+def mpesa_transaction_saved(sender, instance, **kwargs):
+    _invalidate_score(instance.user_id)
+
+def connect_signals():
+    from apps.users.models import User, UserProfile, MpesaTransaction
+    from apps.loans.models import Loan
+
+    post_save.connect(profile_saved, sender=UserProfile, dispatch_uid='credit_features_profile')
+    post_save.connect(user_saved, sender=User, dispatch_uid='credit_features_user')
+    post_save.connect(loan_changed, sender=Loan, dispatch_uid='credit_features_loan_saved')
+    post_delete.connect(loan_changed, sender=Loan, dispatch_uid='credit_features_loan_deleted')
+    post_save.connect(mpesa_transaction_saved, sender=MpesaTransaction, dispatch_uid='credit_score_mpesa_transaction')
@@ -4,7 +4,10 @@ from . import views
 urlpatterns = [
     # Credit Scoring APIs
     path('score/predict/', views.CreditScoreAPI.as_view(), name='predict_credit_score'),
+    path('score/batch/', views.BatchCreditScoreAPI.as_view(), name='batch_credit_score'),
     path('score/train/', views.ModelTrainingAPI.as_view(), name='train_model'),
+    path('score/train/jobs/', views.TrainingJobStatusAPI.as_view(), name='latest_training_job'),
+    path('score/train/jobs/<str:job_id>/', views.TrainingJobStatusAPI.as_view(), name='training_job_status'),
     path('score/model-info/', views.ModelTrainingAPI.as_view(), name='model_info'),
     path('score/quick-check/', views.quick_credit_check, name='quick_credit_check'),
     
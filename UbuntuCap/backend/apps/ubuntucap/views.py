@@ -1,4 +1,5 @@
 from django.http import JsonResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.views import View
@@ -11,15 +12,14 @@ from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# The model itself is loaded lazily on first use (see get_credit_model)
 try:
-    from apps.ubuntucap.ml_engine.credit_scorer import CreditScoringModel
-    credit_model = CreditScoringModel()
+    from apps.ubuntucap.ml_engine.credit_scorer import get_credit_model
     ML_MODEL_LOADED = True
-    logger.info("✓ ML Credit Scoring Model loaded successfully")
 except ImportError as e:
     logger.error(f"Failed to load ML model: {e}")
     ML_MODEL_LOADED = False
-    credit_model = None
+    get_credit_model = None
 
 # Credit Score Prediction API
 class CreditScoreAPI(APIView):
@@ -36,6 +36,7 @@ class CreditScoreAPI(APIView):
                 }, status=503)
             
             user = request.user
+            credit_model = get_credit_model()
             
             # Predict credit score using ML
             score = credit_model.predict_credit_score(user)
@@ -68,6 +69,60 @@ class CreditScoreAPI(APIView):
                 'details': str(e)
             }, status=500)
 
+# Bulk Credit Score API (Admin only)
+class BatchCreditScoreAPI(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """Re-score many users in one pass (Admin only)"""
+        try:
+            if not request.user.is_staff:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Admin access required for bulk scoring'
+                }, status=403)
+
+            if not ML_MODEL_LOADED:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'ML model not loaded. Please check server logs.'
+                }, status=503)
+
+            from apps.users.models import User
+
+            data = json.loads(request.body) if request.body else {}
+            user_ids = data.get('user_ids')
+
+            users = User.objects.filter(is_active=True)
+            if user_ids:
+                users = users.filter(id__in=user_ids)
+
+            started = datetime.now()
+            scores = get_credit_model().predict_credit_scores(users)
+            elapsed = (datetime.now() - started).total_seconds()
+
+            logger.info(f"Bulk scored {len(scores)} users in {elapsed:.2f}s")
+
+            return JsonResponse({
+                'success': True,
+                'users_scored': len(scores),
+                'scores': [
+                    {'user_id': str(user_id), 'credit_score': round(score, 2)}
+                    for user_id, score in scores.items()
+                ],
+                'elapsed_seconds': round(elapsed, 3),
+                'timestamp': datetime.now().isoformat()
+            })
+
+        except Exception as e:
+            logger.error(f"Bulk credit scoring error: {str(e)}")
+            return JsonResponse({
+                'success': False,
+                'error': 'Bulk credit scoring failed',
+                'details': str(e)
+            }, status=500)
+
 # Model Training API (Admin only)
 class ModelTrainingAPI(APIView):
     authentication_classes = [JWTAuthentication]
@@ -83,15 +138,33 @@ class ModelTrainingAPI(APIView):
                     'error': 'Admin access required to train model'
                 }, status=403)
             
-            # For now, return success since we're using rule-based scoring
-            # In production, this would train on real user data
+            from apps.ubuntucap.ml_engine.training.jobs import TrainingJobRunner, TrainingJobConflict
+            
+            # Training runs in its own process; this request only queues it
+            try:
+                options = json.loads(request.body) if request.body else {}
+                job = TrainingJobRunner().submit(options, requested_by=str(request.user.pk))
+            except ValueError as e:
+                # Includes malformed JSON (JSONDecodeError is a ValueError)
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Invalid training options',
+                    'details': str(e)
+                }, status=400)
+            except TrainingJobConflict as e:
+                return JsonResponse({
+                    'success': False,
+                    'error': str(e),
+                    'job': e.job
+                }, status=409)
+            
             return JsonResponse({
                 'success': True,
-                'message': 'Model training initiated',
-                'note': 'Currently using rule-based scoring. Real ML training will be implemented with sufficient user data.',
-                'model_type': 'XGBoost Gradient Boosting',
+                'message': 'Model training started',
+                'job': job,
+                'status_url': reverse('training_job_status', kwargs={'job_id': job['job_id']}),
                 'timestamp': datetime.now().isoformat()
-            })
+            }, status=202)
             
         except Exception as e:
             logger.error(f"Model training error: {str(e)}")
@@ -104,6 +177,7 @@ class ModelTrainingAPI(APIView):
     def get(self, request):
         """Get model information"""
         try:
+            credit_model = get_credit_model() if ML_MODEL_LOADED else None
             model_info = {
                 'success': True,
                 'model_loaded': ML_MODEL_LOADED,
@@ -116,6 +190,13 @@ class ModelTrainingAPI(APIView):
             if ML_MODEL_LOADED:
                 feature_importance = credit_model.get_feature_importance()
                 model_info['feature_importance'] = feature_importance
+                model_info['model_version'] = credit_model.model_version
+                if credit_model.batcher is not None:
+                    model_info['micro_batching'] = credit_model.batcher.stats()
+                model_info['shadow'] = credit_model.shadow_stats()
+            
+            from apps.ubuntucap.ml_engine.score_cache import score_cache
+            model_info['score_cache'] = score_cache.stats()
             
             return JsonResponse(model_info)
             
@@ -125,6 +206,39 @@ class ModelTrainingAPI(APIView):
                 'error': str(e)
             }, status=500)
 
+# Training Job Status API (Admin only)
+class TrainingJobStatusAPI(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, job_id=None):
+        """Get a training job's state, or the most recent job"""
+        try:
+            if not request.user.is_staff:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Admin access required'
+                }, status=403)
+            
+            from apps.ubuntucap.ml_engine.training.jobs import TrainingJobRunner
+            
+            runner = TrainingJobRunner()
+            job = runner.get(job_id) if job_id else runner.latest()
+            if job is None:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Training job not found'
+                }, status=404)
+            
+            return JsonResponse({'success': True, 'job': job})
+            
+        except Exception as e:
+            logger.error(f"Training job status error: {str(e)}")
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=500)
+
 # Loan Application with ML Scoring
 class LoanApplicationAPI(APIView):
     authentication_classes = [JWTAuthentication]
@@ -145,6 +259,7 @@ class LoanApplicationAPI(APIView):
                 }, status=400)
             
             # Get credit score
+            credit_model = get_credit_model()
             credit_score = credit_model.predict_credit_score(user)
             risk_level, risk_reason = credit_model.predict_credit_risk(user)
             
@@ -280,7 +395,8 @@ class MpesaAnalysisAPI(APIView):
                     'success': True,
                     'user_phone': user.phone_number,
                     'transaction_analysis': {
-                        'total_transactions_analyzed': len(transactions),
+                        'total_transactions_analyzed': user.profile.transaction_count_90d,
+                        'new_transactions_synced': len(transactions),
                         'analysis_period_days': 90,
                         'qualification_status': analysis['qualification_status'],
                         'recommended_loan_limit': analysis['recommended_loan_limit'],
@@ -373,6 +489,7 @@ class SyncMpesaDataAPI(APIView):
         try:
             from apps.ubuntucap.services.mpesa_service import MpesaService
             
+            data = json.loads(request.body) if request.body else {}
             user = request.user
             
             if not user.mpesa_consent_granted:
@@ -381,8 +498,10 @@ class SyncMpesaDataAPI(APIView):
                     'error': 'M-Pesa consent not granted. Please update your profile to grant consent.'
                 }, status=400)
             
+            # Only transactions since the last sync are fetched unless a full resync is requested
+            full_resync = bool(data.get('full_resync', False))
             mpesa_service = MpesaService()
-            transactions = mpesa_service.get_transaction_history(user)
+            transactions = mpesa_service.get_transaction_history(user, full_resync=full_resync)
             
             # Get updated profile data
             profile = user.profile
@@ -391,6 +510,9 @@ class SyncMpesaDataAPI(APIView):
             response_data = {
                 'success': True,
                 'transactions_synced': len(transactions),
+                'full_resync': full_resync,
+                'new_transactions': mpesa_service.last_ingest['inserted'],
+                'duplicate_transactions': mpesa_service.last_ingest['duplicates'],
                 'last_sync': profile.mpesa_last_sync.isoformat() if profile.mpesa_last_sync else None,
                 'current_metrics': {
                     'avg_monthly_volume': float(profile.avg_monthly_volume),
@@ -485,6 +607,7 @@ def quick_credit_check(request):
         mock_user = MockUser(data)
         
         if ML_MODEL_LOADED:
+            credit_model = get_credit_model()
             score = credit_model.predict_credit_score(mock_user)
             risk_level, reason = credit_model.predict_credit_risk(mock_user)
         else:
@@ -0,0 +1,93 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0004_alter_user_email"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="mpesatransaction",
+            options={"ordering": ["-transaction_time"]},
+        ),
+        migrations.AlterField(
+            model_name="userprofile",
+            name="credit_score",
+            field=models.IntegerField(default=500),
+        ),
+        migrations.CreateModel(
+            name="MpesaDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("inflow_count", models.IntegerField(default=0)),
+                (
+                    "inflow_total",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("outflow_count", models.IntegerField(default=0)),
+                (
+                    "outflow_total",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "min_amount",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                (
+                    "max_amount",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                (
+                    "min_balance",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=12, null=True
+                    ),
+                ),
+                (
+                    "max_balance",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=12, null=True
+                    ),
+                ),
+                ("high_risk_count", models.IntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="mpesa_daily_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "mpesa_daily_rollups",
+                "ordering": ["-day"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="mpesadailyrollup",
+            constraint=models.UniqueConstraint(
+                fields=("user", "day"), name="unique_mpesa_rollup_user_day"
+            ),
+        ),
+    ]
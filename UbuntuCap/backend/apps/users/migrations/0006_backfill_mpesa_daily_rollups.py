@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def backfill_rollups(apps, schema_editor):
+    # Profile metrics are read from rollups only, so build them for the
+    # transactions stored before rollups existed
+    from apps.ubuntucap.services.mpesa_service import rebuild_daily_rollups
+
+    rebuild_daily_rollups()
+
+
+def clear_rollups(apps, schema_editor):
+    apps.get_model("users", "MpesaDailyRollup").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0005_alter_mpesatransaction_options_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, clear_rollups),
+    ]
@@ -190,4 +190,33 @@ class MpesaTransaction(models.Model):
         ordering = ['-transaction_time']
     
     def __str__(self):
-        return f"{self.transaction_id} - {self.amount} - {self.user.phone_number}"
\ No newline at end of file
+        return f"{self.transaction_id} - {self.amount} - {self.user.phone_number}"
+
+class MpesaDailyRollup(models.Model):
+    """Per-user daily M-Pesa totals, maintained when transactions are ingested"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mpesa_daily_rollups')
+    day = models.DateField()
+    
+    # Inflow is money received; every other transaction type is outflow
+    inflow_count = models.IntegerField(default=0)
+    inflow_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    outflow_count = models.IntegerField(default=0)
+    outflow_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    min_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    min_balance = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    max_balance = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    high_risk_count = models.IntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'mpesa_daily_rollups'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_mpesa_rollup_user_day'),
+        ]
+        ordering = ['-day']
+    
+    def __str__(self):
+        return f"{self.user.phone_number} - {self.day}"
@@ -73,6 +73,33 @@ DATABASES = {
     }
 }
 
+# Cache - credit scores are cached per user and model version (LRU + TTL)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'credit_scores': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'credit-scores',
+        'TIMEOUT': config('CREDIT_SCORE_CACHE_TIMEOUT', default=900, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CREDIT_SCORE_CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    },
+}
+
+# Shared score cache (e.g. redis://localhost:6379/1). Invalidation on save only reaches
+# other web workers and management commands through a shared backend; the local-memory
+# fallback above is for single-process development only.
+CREDIT_SCORE_CACHE_URL = config('CREDIT_SCORE_CACHE_URL', default='')
+if CREDIT_SCORE_CACHE_URL:
+    CACHES['credit_scores'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CREDIT_SCORE_CACHE_URL,
+        'KEY_PREFIX': 'ubuntucap',
+        'TIMEOUT': config('CREDIT_SCORE_CACHE_TIMEOUT', default=900, cast=int),
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -101,6 +128,39 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Credit model loading - the model loads lazily on first use unless warm-up is enabled
+CREDIT_MODEL_WARMUP = config('CREDIT_MODEL_WARMUP', default=False, cast=bool)
+
+# Seconds between checks for a retrained model (0 disables hot reload)
+CREDIT_MODEL_RELOAD_INTERVAL = config('CREDIT_MODEL_RELOAD_INTERVAL', default=30, cast=int)
+
+# Load model artifacts with mmap_mode='r' so workers share the compiled ensemble's arrays
+CREDIT_MODEL_MMAP = config('CREDIT_MODEL_MMAP', default=True, cast=bool)
+
+# Serve tree ensembles from the flattened evaluator alone; the sklearn model is only loaded for feature importance
+CREDIT_MODEL_COMPILED = config('CREDIT_MODEL_COMPILED', default=True, cast=bool)
+
+# Group concurrent single-row predictions into one model call (only helps threaded workers)
+CREDIT_MODEL_MICROBATCH = config('CREDIT_MODEL_MICROBATCH', default=False, cast=bool)
+CREDIT_MODEL_MICROBATCH_MAX_SIZE = config('CREDIT_MODEL_MICROBATCH_MAX_SIZE', default=32, cast=int)
+CREDIT_MODEL_MICROBATCH_MAX_WAIT_MS = config('CREDIT_MODEL_MICROBATCH_MAX_WAIT_MS', default=2, cast=float)
+
+# p99 single-row scoring budget used to penalize slow models during hyperparameter search
+CREDIT_MODEL_LATENCY_BUDGET_MS = config('CREDIT_MODEL_LATENCY_BUDGET_MS', default=5.0, cast=float)
+
+# Incremental retraining: trees/stages added per update, and how often a full rebuild runs instead
+CREDIT_MODEL_INCREMENTAL_ESTIMATORS = config('CREDIT_MODEL_INCREMENTAL_ESTIMATORS', default=10, cast=int)
+CREDIT_MODEL_FULL_REBUILD_DAYS = config('CREDIT_MODEL_FULL_REBUILD_DAYS', default=7, cast=int)
+
+# Changed rows needed before an incremental update runs; smaller deltas wait for the next run
+CREDIT_MODEL_INCREMENTAL_MIN_ROWS = config('CREDIT_MODEL_INCREMENTAL_MIN_ROWS', default=20, cast=int)
+
+# Model versions kept in ml_models/versions (the live and previous ones are always kept)
+CREDIT_MODEL_KEEP_VERSIONS = config('CREDIT_MODEL_KEEP_VERSIONS', default=10, cast=int)
+
+# Rows queued for the shadow model before new ones are dropped (train_model --shadow VERSION)
+CREDIT_MODEL_SHADOW_QUEUE_SIZE = config('CREDIT_MODEL_SHADOW_QUEUE_SIZE', default=10000, cast=int)
+
 # Custom user model
 AUTH_USER_MODEL = 'users.User'
 
@@ -243,6 +303,15 @@ MPESA_TRANSACTION_STATUS_CALLBACK_URL = f"{MPESA_CALLBACK_BASE_URL}/api/mpesa/tr
 # M-Pesa Timeout (in seconds)
 MPESA_REQUEST_TIMEOUT = 30
 
+# Rows per INSERT / lookup when storing synced M-Pesa transactions
+MPESA_INGEST_BATCH_SIZE = config('MPESA_INGEST_BATCH_SIZE', default=500, cast=int)
+
+# Concurrent M-Pesa fetches during the bulk sync (sync_mpesa_data --workers)
+MPESA_SYNC_WORKERS = config('MPESA_SYNC_WORKERS', default=8, cast=int)
+
+# Users loaded, fetched and ingested together during the bulk sync
+MPESA_SYNC_CHUNK_SIZE = config('MPESA_SYNC_CHUNK_SIZE', default=200, cast=int)
+
 # M-Pesa Security Configuration
 MPESA_INITIATOR_NAME = config('MPESA_INITIATOR_NAME', default='testapi')
 MPESA_INITIATOR_SECURITY_CREDENTIAL = config('MPESA_INITIATOR_SECURITY_CREDENTIAL', default='')